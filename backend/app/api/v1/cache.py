@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+
+from app.services.cache import all_stats
+
+router = APIRouter(prefix="/cache", tags=["cache"])
+
+
+@router.get("/stats")
+async def cache_stats():
+    return {"caches": all_stats()}
@@ -1,12 +1,11 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException, Request
-from fastapi.concurrency import run_in_threadpool
 
 from app.models.image import (
     ImageUploadResponse,
     ImageGenerateRequest,
     ImageGenerateResponse,
 )
-from app.services.storage import save_upload
+from app.services.storage import save_upload, UploadTooLargeError
 from app.services import replicate
 
 router = APIRouter(prefix="/image", tags=["image"])
@@ -17,7 +16,10 @@ async def upload_image(request: Request, file: UploadFile = File(...)):
     if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="File must be an image")
 
-    file_id, relative_url = await save_upload(file)
+    try:
+        file_id, relative_url = await save_upload(file)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=413, detail=str(e))
     base_url = str(request.base_url).rstrip("/")
     full_url = f"{base_url}{relative_url}"
 
@@ -25,10 +27,11 @@ async def upload_image(request: Request, file: UploadFile = File(...)):
 
 
 @router.post("/generate", response_model=ImageGenerateResponse)
-async def generate_image(request: ImageGenerateRequest):
-    output_url = await run_in_threadpool(
-        replicate.create_image_sync,
-        request.source_image_url,
-        request.style_prompt,
+async def generate_image(request: Request, body: ImageGenerateRequest):
+    relative_url = await replicate.create_image(
+        body.source_image_url,
+        body.style_prompt,
+        use_cache=body.use_cache,
     )
-    return ImageGenerateResponse(output_url=output_url)
+    base_url = str(request.base_url).rstrip("/")
+    return ImageGenerateResponse(output_url=f"{base_url}{relative_url}")
@@ -0,0 +1,94 @@
+import asyncio
+from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.models.job import JobCreateRequest, JobResponse, JobStage
+from app.services import jobs
+
+router = APIRouter(prefix="/jobs", tags=["jobs"])
+
+
+def _absolute(base_url: str, value):
+    if isinstance(value, str) and value.startswith("/uploads/"):
+        return f"{base_url}{value}"
+    return value
+
+
+def _duration(started_at: float | None, finished_at: float | None) -> float | None:
+    if started_at is None or finished_at is None:
+        return None
+    return round(finished_at - started_at, 3)
+
+
+def _to_response(request: Request, job: dict) -> JobResponse:
+    base_url = str(request.base_url).rstrip("/")
+    finished_at = job["updated_at"] if job["status"] in jobs.TERMINAL_STATUSES else None
+    return JobResponse(
+        id=job["id"],
+        status=job["status"],
+        stages={
+            name: JobStage(
+                status=stage["status"],
+                output={k: _absolute(base_url, v) for k, v in stage["output"].items()},
+                error=stage["error"],
+                started_at=stage.get("started_at"),
+                finished_at=stage.get("finished_at"),
+                duration=_duration(stage.get("started_at"), stage.get("finished_at")),
+            )
+            for name, stage in job["stages"].items()
+        },
+        output_url=_absolute(base_url, job["output_url"]),
+        error=job["error"],
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+        duration=_duration(job["created_at"], finished_at),
+    )
+
+
+@router.post("", response_model=JobResponse, status_code=202)
+async def create_job(request: Request, body: JobCreateRequest):
+    try:
+        job = await jobs.create_job(body.model_dump())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return _to_response(request, job)
+
+
+@router.get("/{job_id}", response_model=JobResponse)
+async def get_job(request: Request, job_id: str):
+    job = await jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _to_response(request, job)
+
+
+@router.get("/{job_id}/events")
+async def job_events(request: Request, job_id: str):
+    job = await jobs.get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        queue = jobs.subscribe(job_id)
+        try:
+            # Re-read after subscribing so no update between the two is lost
+            current = await jobs.get_job(job_id)
+            yield f"event: progress\ndata: {_to_response(request, current).model_dump_json()}\n\n"
+            while current["status"] not in jobs.TERMINAL_STATUSES:
+                try:
+                    update = await asyncio.wait_for(queue.get(), timeout=15.0)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if update["updated_at"] < current["updated_at"]:
+                    continue
+                current = update
+                yield f"event: progress\ndata: {_to_response(request, current).model_dump_json()}\n\n"
+        finally:
+            jobs.unsubscribe(job_id, queue)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
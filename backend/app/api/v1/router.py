@@ -1,8 +1,11 @@
 from fastapi import APIRouter
 
-from app.api.v1 import image, voice, video
+from app.api.v1 import image, voice, video, webhooks, jobs, cache
 
 router = APIRouter()
 router.include_router(image.router)
 router.include_router(voice.router)
 router.include_router(video.router)
+router.include_router(webhooks.router)
+router.include_router(jobs.router)
+router.include_router(cache.router)
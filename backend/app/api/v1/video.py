@@ -1,6 +1,9 @@
+import asyncio
 import logging
 from fastapi import APIRouter, Request, HTTPException
+from fastapi.responses import StreamingResponse
 
+from app.config import get_settings
 from app.models.video import (
     VideoGenerateRequest,
     VideoGenerateResponse,
@@ -8,17 +11,40 @@ from app.models.video import (
     VideoMergeRequest,
     VideoMergeResponse,
     VideoBackgroundRequest,
+    VideoBackgroundPreviewRequest,
+    VideoBackgroundBatchRequest,
+    VideoBackgroundBatchResponse,
     VideoBackgroundResponse,
 )
 from app.services import replicate
 from app.services import openai_service
-from app.services.ffmpeg import replace_greenscreen
+from app.services import prediction_store
+from app.services import ffmpeg_pool
+from app.services.ffmpeg import render_preview, replace_greenscreen, replace_greenscreen_batch, stream_merge
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/video", tags=["video"])
 
 
+async def _cancel_on_disconnect(request: Request, coro):
+    # Starlette keeps running a handler after the client goes away, so watch
+    # for the disconnect and cancel the work (which kills its ffmpeg process)
+    task = asyncio.ensure_future(coro)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=1.0)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                logger.info(f"Client disconnected, cancelling {request.url.path}")
+                task.cancel()
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    finally:
+        if not task.done():
+            task.cancel()
+
+
 @router.post("/generate", response_model=VideoGenerateResponse)
 async def generate_video(body: VideoGenerateRequest):
     animation_instructions = None
@@ -53,6 +79,7 @@ async def generate_video(body: VideoGenerateRequest):
         hand_arm_gestures=hand_arm_gestures,
         style=body.style,
     )
+    prediction_store.track(result)
     return VideoGenerateResponse(
         prediction_id=result["id"],
         status=result["status"],
@@ -61,7 +88,7 @@ async def generate_video(body: VideoGenerateRequest):
 
 @router.get("/status/{prediction_id}", response_model=VideoStatusResponse)
 async def get_video_status(prediction_id: str):
-    result = await replicate.get_prediction_status(prediction_id)
+    result = await prediction_store.get_status(prediction_id)
     output_url = None
     if result["status"] == "succeeded" and result.get("output"):
         output = result["output"]
@@ -82,26 +109,128 @@ async def merge_video(request: Request, body: VideoMergeRequest):
         
         logger.info(f"Applying lip sync - Video: {video_url}, Audio: {audio_path_or_url}")
         
-        output_url = await replicate.apply_lipsync(
+        result = await replicate.create_lipsync_prediction(
             video_url=video_url,
             audio_path_or_url=audio_path_or_url,
         )
-        
-        return VideoMergeResponse(output_url=output_url)
+        prediction_store.track(result)
+        status = await prediction_store.wait(result["id"], get_settings().job_poll_interval)
+        if status["status"] != "succeeded" or not status.get("output"):
+            raise RuntimeError(status.get("error") or f"Lip sync prediction {status['status']}")
+
+        return VideoMergeResponse(output_url=status["output"])
     except Exception as e:
         logger.error(f"Failed to apply lip sync: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/merge/async", response_model=VideoGenerateResponse)
+async def merge_video_async(body: VideoMergeRequest):
+    # Starts lip sync and returns the prediction id right away; poll it with
+    # GET /video/status/{prediction_id}
+    try:
+        result = await replicate.create_lipsync_prediction(
+            video_url=body.video_url,
+            audio_path_or_url=body.audio_url,
+        )
+    except Exception as e:
+        logger.error(f"Failed to start lip sync: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+    prediction_store.track(result)
+    return VideoGenerateResponse(
+        prediction_id=result["id"],
+        status=result["status"],
+    )
+
+
+@router.post("/mux/stream")
+async def stream_muxed_video(body: VideoMergeRequest):
+    # Muxes the audio onto the video in one ffmpeg pass and streams the
+    # result as fragmented mp4; nothing is written to disk. The first chunk
+    # is awaited here so download and ffmpeg errors still get a status code.
+    chunks = stream_merge(body.video_url, body.audio_url, ffmpeg_pool.PRIORITY_HIGH)
+    try:
+        first = await anext(chunks, b"")
+    except Exception as e:
+        logger.error(f"Failed to mux audio and video: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def relay():
+        yield first
+        async for chunk in chunks:
+            yield chunk
+
+    return StreamingResponse(relay(), media_type="video/mp4", headers={"Cache-Control": "no-store"})
+
+
 @router.post("/apply-background", response_model=VideoBackgroundResponse)
 async def apply_background(request: Request, body: VideoBackgroundRequest):
     try:
-        relative_url = await replace_greenscreen(
+        relative_url = await _cancel_on_disconnect(request, replace_greenscreen(
             video_url=body.video_url,
             background_url=body.background_url,
             scale=body.scale,
-        )
+            profile=body.profile,
+            key_color=body.key_color,
+            key_similarity=body.key_similarity,
+            key_blend=body.key_blend,
+            priority=ffmpeg_pool.PRIORITY_HIGH,
+        ))
+        base_url = str(request.base_url).rstrip("/")
+        return VideoBackgroundResponse(output_url=f"{base_url}{relative_url}")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ffmpeg_pool.FFmpegQueueTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/apply-background/batch", response_model=VideoBackgroundBatchResponse)
+async def apply_background_batch(request: Request, body: VideoBackgroundBatchRequest):
+    try:
+        relative_urls = await _cancel_on_disconnect(request, replace_greenscreen_batch(
+            video_url=body.video_url,
+            background_urls=body.background_urls,
+            scale=body.scale,
+            profile=body.profile,
+            key_color=body.key_color,
+            key_similarity=body.key_similarity,
+            key_blend=body.key_blend,
+            priority=ffmpeg_pool.PRIORITY_HIGH,
+        ))
+        base_url = str(request.base_url).rstrip("/")
+        return VideoBackgroundBatchResponse(output_urls=[f"{base_url}{url}" for url in relative_urls])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ffmpeg_pool.FFmpegQueueTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/apply-background/preview", response_model=VideoBackgroundResponse)
+async def preview_background(request: Request, body: VideoBackgroundPreviewRequest):
+    try:
+        relative_url = await _cancel_on_disconnect(request, render_preview(
+            video_url=body.video_url,
+            background_url=body.background_url,
+            scale=body.scale,
+            mode=body.mode,
+            timestamp=body.timestamp,
+            duration=body.duration,
+            key_color=body.key_color,
+            key_similarity=body.key_similarity,
+            key_blend=body.key_blend,
+        ))
         base_url = str(request.base_url).rstrip("/")
         return VideoBackgroundResponse(output_url=f"{base_url}{relative_url}")
+    except ffmpeg_pool.FFmpegQueueTimeout as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except RuntimeError as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/ffmpeg/stats")
+async def ffmpeg_stats():
+    return ffmpeg_pool.stats()
@@ -1,16 +1,23 @@
+import json
 import uuid
+import tempfile
+from pathlib import Path
 from fastapi import APIRouter, Request, UploadFile, File, HTTPException
+from fastapi.responses import StreamingResponse
 
 from app.models.voice import (
     VoiceGenerateRequest,
+    VoiceGenerateStreamRequest,
     VoiceGenerateResponse,
     VoiceSample,
     VoiceCloneResponse,
     VoiceCloneGenerateRequest,
     VoiceCloneGenerateResponse,
+    VoiceStreamStatusResponse,
 )
 from app.services import hume
 from app.services import elevenlabs
+from app.services.storage import write_upload, UploadTooLargeError
 
 router = APIRouter(prefix="/voice", tags=["voice"])
 
@@ -20,6 +27,7 @@ async def generate_voice(request: Request, body: VoiceGenerateRequest):
     samples_data = await hume.generate_voice_samples(
         text=body.text,
         voice_description=body.voice_description,
+        use_cache=body.use_cache,
     )
 
     base_url = str(request.base_url).rstrip("/")
@@ -35,26 +43,99 @@ async def generate_voice(request: Request, body: VoiceGenerateRequest):
     return VoiceGenerateResponse(samples=samples)
 
 
+@router.post("/generate/stream")
+async def stream_voice(request: Request, body: VoiceGenerateStreamRequest):
+    # Server-sent events: one "sample" (or "error") event per generation as it
+    # completes, then "done"
+    base_url = str(request.base_url).rstrip("/")
+
+    async def event_stream():
+        samples = hume.stream_voice_samples(
+            text=body.text,
+            voice_description=body.voice_description,
+            count=body.count,
+            use_cache=body.use_cache,
+        )
+        try:
+            async for sample in samples:
+                if "error" in sample:
+                    yield f"event: error\ndata: {json.dumps(sample)}\n\n"
+                    continue
+                data = VoiceSample(
+                    id=sample["id"],
+                    audio_url=f"{base_url}{sample['audio_url']}",
+                    duration=sample["duration"],
+                )
+                yield f"event: sample\ndata: {data.model_dump_json()}\n\n"
+            yield "event: done\ndata: {}\n\n"
+        finally:
+            await samples.aclose()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @router.post("/clone", response_model=VoiceCloneResponse)
 async def clone_voice(file: UploadFile = File(...)):
     if not file.content_type or not file.content_type.startswith("audio/"):
         raise HTTPException(status_code=400, detail="File must be an audio file")
 
-    audio_bytes = await file.read()
-    voice_name = f"clone_{uuid.uuid4().hex[:8]}"
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        ext = Path(file.filename).suffix if file.filename else ".bin"
+        audio_path = Path(tmp_dir) / f"clone_{uuid.uuid4().hex[:8]}{ext}"
+        try:
+            audio_sha256, _ = await write_upload(file, audio_path)
+        except UploadTooLargeError as e:
+            raise HTTPException(status_code=413, detail=str(e))
 
-    try:
-        voice_id = await elevenlabs.clone_voice(audio_bytes, voice_name)
-        return VoiceCloneResponse(voice_id=voice_id)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to clone voice: {str(e)}")
+        try:
+            voice_id = await elevenlabs.get_or_clone_voice(audio_path, audio_sha256)
+            return VoiceCloneResponse(voice_id=voice_id)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Failed to clone voice: {str(e)}")
 
 
 @router.post("/clone/generate", response_model=VoiceCloneGenerateResponse)
 async def generate_cloned_voice(request: Request, body: VoiceCloneGenerateRequest):
     try:
-        audio_url = await elevenlabs.generate_speech(body.voice_id, body.text)
+        audio_url = await elevenlabs.generate_speech(body.voice_id, body.text, body.use_cache)
         base_url = str(request.base_url).rstrip("/")
         return VoiceCloneGenerateResponse(audio_url=f"{base_url}{audio_url}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate speech: {str(e)}")
+
+
+@router.post("/clone/generate/stream")
+async def stream_cloned_voice(body: VoiceCloneGenerateRequest):
+    # Relays audio/mpeg chunks as ElevenLabs produces them. The stored file's
+    # URL is available from the status endpoint once the stream has finished.
+    try:
+        stream_id, chunks = await elevenlabs.stream_speech(body.voice_id, body.text, body.use_cache)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to generate speech: {str(e)}")
+
+    return StreamingResponse(
+        chunks,
+        media_type="audio/mpeg",
+        headers={"X-Stream-Id": stream_id, "Cache-Control": "no-store"},
+    )
+
+
+@router.get("/clone/generate/stream/{stream_id}", response_model=VoiceStreamStatusResponse)
+async def get_cloned_voice_stream(request: Request, stream_id: str):
+    stream = elevenlabs.get_stream(stream_id)
+    if stream is None:
+        raise HTTPException(status_code=404, detail="Stream not found")
+
+    audio_url = stream["audio_url"]
+    if audio_url:
+        audio_url = f"{str(request.base_url).rstrip('/')}{audio_url}"
+    return VoiceStreamStatusResponse(
+        stream_id=stream_id,
+        status=stream["status"],
+        audio_url=audio_url,
+        error=stream["error"],
+    )
@@ -0,0 +1,40 @@
+import json
+import logging
+from fastapi import APIRouter, Request, HTTPException
+from replicate.webhook import WebhookValidationError
+
+from app.services import replicate
+from app.services import prediction_store
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(prefix="/webhooks", tags=["webhooks"])
+
+
+@router.post("/replicate")
+async def replicate_webhook(request: Request):
+    # Unsigned webhooks are never accepted, so without a secret the endpoint is off
+    if not replicate.webhooks_enabled():
+        raise HTTPException(status_code=404, detail="Webhooks are not enabled")
+
+    body = (await request.body()).decode()
+    try:
+        replicate.validate_webhook(dict(request.headers), body)
+    except WebhookValidationError as e:
+        logger.warning(f"Rejected Replicate webhook: {str(e)}")
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+
+    try:
+        payload = json.loads(body)
+    except json.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON body")
+    if not payload.get("id") or not payload.get("status"):
+        raise HTTPException(status_code=400, detail="Missing prediction id or status")
+
+    # Only predictions we started (or are already tracking) are updated
+    if not prediction_store.is_tracked(payload["id"]):
+        logger.info(f"Ignoring webhook for untracked prediction {payload['id']}")
+        return {"status": "ignored"}
+
+    prediction_store.put(payload["id"], replicate.status_from_prediction(payload))
+    return {"status": "ok"}
@@ -0,0 +1,149 @@
+import logging
+import httpx
+import replicate
+from elevenlabs.client import AsyncElevenLabs, ElevenLabs
+from openai import OpenAI
+from replicate.client import _build_httpx_client
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# Providers whose endpoints negotiate HTTP/2; everything else stays on HTTP/1.1
+HTTP2_PROVIDERS = {"replicate", "hume", "elevenlabs", "downloads"}
+
+_http: dict[str, httpx.AsyncClient] = {}
+_sdk: dict[str, object] = {}
+# Connection pools handed to SDK clients, owned here so they can be closed
+_transports: list[httpx.AsyncHTTPTransport] = []
+_sync_http: list[httpx.Client] = []
+
+
+def _limits(provider: str) -> httpx.Limits:
+    settings = get_settings()
+    max_connections = settings.http_max_connections.get(provider, 20)
+    return httpx.Limits(
+        max_connections=max_connections,
+        max_keepalive_connections=min(max_connections, settings.http_max_keepalive_connections),
+        keepalive_expiry=settings.http_keepalive_expiry,
+    )
+
+
+def _http2(provider: str) -> bool:
+    return HTTP2_AVAILABLE and provider in HTTP2_PROVIDERS
+
+
+def http(provider: str) -> httpx.AsyncClient:
+    client = _http.get(provider)
+    if client is None:
+        client = httpx.AsyncClient(
+            limits=_limits(provider),
+            http2=_http2(provider),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            follow_redirects=True,
+        )
+        _http[provider] = client
+    return client
+
+
+class _ReplicateClient(replicate.Client):
+    # replicate.Client passes its extra kwargs to both the sync and the async
+    # httpx client, so a pooled AsyncHTTPTransport can't go in as transport=.
+    # Only the async client gets it; sync calls keep the SDK's own transport.
+    def __init__(self, *args, async_transport: httpx.AsyncHTTPTransport, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pooled_async_client = _build_httpx_client(
+            httpx.AsyncClient,
+            self._api_token,
+            self._base_url,
+            self._timeout,
+            transport=async_transport,
+        )
+
+    @property
+    def _async_client(self) -> httpx.AsyncClient:
+        return self._pooled_async_client
+
+
+def replicate_client() -> replicate.Client:
+    if "replicate" not in _sdk:
+        settings = get_settings()
+        transport = httpx.AsyncHTTPTransport(
+            limits=_limits("replicate"),
+            http2=_http2("replicate"),
+        )
+        _transports.append(transport)
+        _sdk["replicate"] = _ReplicateClient(
+            api_token=settings.replicate_api_token or None,
+            base_url=settings.replicate_base_url or None,
+            async_transport=transport,
+        )
+    return _sdk["replicate"]
+
+
+def openai_client() -> OpenAI:
+    # The OpenAI SDK keeps its own connection pool per client instance
+    if "openai" not in _sdk:
+        settings = get_settings()
+        if not settings.openai_api_key:
+            raise ValueError("OPENAI_API_KEY not set")
+        _sdk["openai"] = OpenAI(api_key=settings.openai_api_key)
+    return _sdk["openai"]
+
+
+def elevenlabs_client() -> ElevenLabs:
+    if "elevenlabs" not in _sdk:
+        settings = get_settings()
+        http_client = httpx.Client(
+            limits=_limits("elevenlabs"),
+            http2=_http2("elevenlabs"),
+            timeout=240.0,
+            follow_redirects=True,
+        )
+        _sync_http.append(http_client)
+        _sdk["elevenlabs"] = ElevenLabs(
+            api_key=settings.elevenlabs_api_key,
+            httpx_client=http_client,
+        )
+    return _sdk["elevenlabs"]
+
+
+def elevenlabs_async_client() -> AsyncElevenLabs:
+    # Used for streaming; shares the pooled "elevenlabs" AsyncClient
+    if "elevenlabs_async" not in _sdk:
+        settings = get_settings()
+        _sdk["elevenlabs_async"] = AsyncElevenLabs(
+            api_key=settings.elevenlabs_api_key,
+            httpx_client=http("elevenlabs"),
+        )
+    return _sdk["elevenlabs_async"]
+
+
+def open_clients():
+    for provider in ("hume", "downloads"):
+        http(provider)
+    replicate_client()
+    elevenlabs_client()
+    logger.info(f"HTTP clients ready (http2={'on' if HTTP2_AVAILABLE else 'off'})")
+
+
+async def close_clients():
+    for client in _http.values():
+        await client.aclose()
+    for transport in _transports:
+        await transport.aclose()
+    for client in _sync_http:
+        client.close()
+    openai = _sdk.get("openai")
+    if openai is not None:
+        openai.close()
+    _http.clear()
+    _sdk.clear()
+    _transports.clear()
+    _sync_http.clear()
@@ -4,10 +4,105 @@ from functools import lru_cache
 
 class Settings(BaseSettings):
     replicate_api_token: str = ""
+
+    # Diagnostic tracing is off unless a path is set
+    trace_log_path: str = ""
+    trace_sample_rate: float = 1.0
+
+    replicate_base_url: str = ""
+    replicate_webhook_secret: str = ""
+    public_base_url: str = ""
+
+    # Per-provider connection pool sizes for the shared clients in app.clients
+    http_max_connections: dict[str, int] = {
+        "replicate": 200,
+        "hume": 20,
+        "elevenlabs": 20,
+        "downloads": 20,
+    }
+    http_max_keepalive_connections: int = 50
+    http_keepalive_expiry: float = 60.0
+
+    prediction_cache_size: int = 1024
+    prediction_status_ttl: float = 3.0
+    prediction_poll_interval: float = 3.0
+    # Predictions created with a webhook are only polled (and their in-flight
+    # status only refetched) this rarely, in case the webhook is lost
+    prediction_webhook_fallback_interval: float = 60.0
+    prediction_track_timeout: float = 900.0
+
+    image_cache_max_entries: int = 500
+    # Uploads through Replicate's files API, reused while still valid
+    replicate_file_cache_max_entries: int = 1000
+    replicate_file_max_age: float = 12 * 60 * 60
+
+    prompt_cache_max_entries: int = 5000
+    prompt_cache_memory_entries: int = 512
+    prompt_cache_near_duplicates: bool = False
+
+    media_cache_max_entries: int = 10000
+    media_cache_memory_entries: int = 1024
+
+    tts_stream_registry_size: int = 1024
+    # Cloned voices we keep on the ElevenLabs account; the least recently used
+    # are deleted to stay under it (keep below the plan's voice limit)
+    elevenlabs_max_cloned_voices: int = 25
+    # Synthesized speech by (provider, voice, text, model, format); audio stays in storage
+    tts_cache_max_entries: int = 5000
+    tts_cache_max_age: float = 30 * 24 * 60 * 60
+
+    # Set to False to fall back to the ffprobe + trim + mux merge
+    ffmpeg_single_pass_merge: bool = True
+    # 0 sizes the ffmpeg pool to the available cores / threads per job
+    ffmpeg_max_processes: int = 0
+    ffmpeg_threads_per_job: int = 2
+    # Seconds a request may wait for an ffmpeg slot, 0 waits forever
+    ffmpeg_queue_timeout: float = 120.0
+
+    # libx264 settings for composited videos; max_height downscales the output.
+    # For x264 a higher CRF means lower quality, so the fast preview uses a
+    # higher CRF than final, not a lower one.
+    encoder_profiles: dict[str, dict] = {
+        "preview": {"preset": "ultrafast", "crf": 30, "max_height": 480},
+        "final": {"preset": "medium", "crf": 20},
+        "web": {"preset": "slow", "crf": 26, "max_height": 720, "faststart": True},
+    }
+    default_encoder_profile: str = "final"
+    preview_max_height: int = 360
+    # Rendered previews, served from upload_dir/previews and bounded by disk use
+    preview_cache_max_entries: int = 500
+    preview_cache_max_bytes: int = 200 * 1024 * 1024
+
+    # Backgrounds pre-scaled to video sizes, bounded by disk use
+    background_cache_max_entries: int = 1000
+    background_cache_max_bytes: int = 500 * 1024 * 1024
+    # Remote inputs (backgrounds, videos) downloaded once, bounded by disk use
+    download_cache_max_entries: int = 500
+    download_cache_max_bytes: int = 2 * 1024 * 1024 * 1024
+    download_cache_max_age: float = 24 * 60 * 60
+    # Chroma-keyed foregrounds (lossless video with alpha) kept for re-compositing
+    foreground_cache_max_entries: int = 200
+    foreground_cache_max_bytes: int = 2 * 1024 * 1024 * 1024
+
+    job_workers: int = 4
+    job_poll_interval: float = 3.0
+    job_provider_concurrency: dict[str, int] = {
+        "replicate": 4,
+        "openai": 4,
+        "hume": 2,
+        "elevenlabs": 2,
+        "ffmpeg": 2,
+    }
+
     hume_api_key: str = ""
     elevenlabs_api_key: str = ""
     openai_api_key: str = ""
     upload_dir: str = "uploads"
+    data_dir: str = "data"
+    max_upload_bytes: int = 50 * 1024 * 1024
+    upload_chunk_size: int = 1024 * 1024
+    download_chunk_size: int = 256 * 1024
+    download_retries: int = 3
 
     class Config:
         env_file = ".env"
@@ -1,14 +1,34 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pathlib import Path
 
+from app import clients
+from app import tracing
 from app.config import get_settings
 from app.api.v1.router import router as api_router
+from app.services import prediction_store
+from app.services import jobs
 
 settings = get_settings()
 
-app = FastAPI(title="Talkaz API")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    tracing.start()
+    clients.open_clients()
+    poller = asyncio.create_task(prediction_store.run_poller())
+    await jobs.start()
+    yield
+    await jobs.stop()
+    poller.cancel()
+    await clients.close_clients()
+    tracing.stop()
+
+
+app = FastAPI(title="Talkaz API", lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,6 +36,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Stream-Id"],
 )
 
 uploads_path = Path(settings.upload_dir)
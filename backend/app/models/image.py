@@ -9,6 +9,7 @@ class ImageUploadResponse(BaseModel):
 class ImageGenerateRequest(BaseModel):
     source_image_url: str
     style_prompt: str
+    use_cache: bool = True
 
 
 class ImageGenerateResponse(BaseModel):
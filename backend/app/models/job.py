@@ -0,0 +1,42 @@
+from pydantic import BaseModel, model_validator
+
+from app.models.video import ChromaKeyParams
+
+
+class JobCreateRequest(ChromaKeyParams):
+    source_image_url: str
+    spoken_line: str
+    style: str = "Playstation 2"
+    scene_description: str = ""
+    duration: float = 5.0
+    voice_id: str | None = None
+    voice_description: str | None = None
+    background_url: str | None = None
+    scale: float = 0.6
+    profile: str | None = None
+
+    @model_validator(mode="after")
+    def check_voice(self):
+        if bool(self.voice_id) == bool(self.voice_description):
+            raise ValueError("Provide exactly one of voice_id or voice_description")
+        return self
+
+
+class JobStage(BaseModel):
+    status: str
+    output: dict = {}
+    error: str | None = None
+    started_at: float | None = None
+    finished_at: float | None = None
+    duration: float | None = None
+
+
+class JobResponse(BaseModel):
+    id: str
+    status: str
+    stages: dict[str, JobStage]
+    output_url: str | None = None
+    error: str | None = None
+    created_at: float
+    updated_at: float
+    duration: float | None = None
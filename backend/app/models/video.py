@@ -1,4 +1,5 @@
-from pydantic import BaseModel
+from typing import Literal
+from pydantic import BaseModel, Field
 
 
 class VideoGenerateRequest(BaseModel):
@@ -29,10 +30,40 @@ class VideoMergeResponse(BaseModel):
     output_url: str
 
 
-class VideoBackgroundRequest(BaseModel):
+class ChromaKeyParams(BaseModel):
+    # Passed to ffmpeg's chromakey filter
+    key_color: str = Field("0x00FF00", pattern=r"^(0x|#)?[0-9a-fA-F]{6}$")
+    key_similarity: float = Field(0.3, gt=0, le=1)
+    key_blend: float = Field(0.1, ge=0, le=1)
+
+
+class VideoBackgroundRequest(ChromaKeyParams):
+    video_url: str
+    background_url: str
+    scale: float = 0.6
+    # One of settings.encoder_profiles (preview, final, web); defaults to final
+    profile: str | None = None
+
+
+class VideoBackgroundBatchRequest(ChromaKeyParams):
+    video_url: str
+    background_urls: list[str] = Field(min_length=1, max_length=8)
+    scale: float = 0.6
+    profile: str | None = None
+
+
+class VideoBackgroundBatchResponse(BaseModel):
+    output_urls: list[str]
+
+
+class VideoBackgroundPreviewRequest(ChromaKeyParams):
     video_url: str
     background_url: str
     scale: float = 0.6
+    # "still" renders one PNG frame at timestamp, "clip" a short low-res mp4
+    mode: Literal["still", "clip"] = "still"
+    timestamp: float = Field(0.0, ge=0)
+    duration: float = Field(2.0, gt=0, le=5)
 
 
 class VideoBackgroundResponse(BaseModel):
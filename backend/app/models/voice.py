@@ -1,9 +1,14 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class VoiceGenerateRequest(BaseModel):
     text: str
     voice_description: str
+    use_cache: bool = True
+
+
+class VoiceGenerateStreamRequest(VoiceGenerateRequest):
+    count: int = Field(3, ge=1, le=5)
 
 
 class VoiceSample(BaseModel):
@@ -23,7 +28,15 @@ class VoiceCloneResponse(BaseModel):
 class VoiceCloneGenerateRequest(BaseModel):
     voice_id: str
     text: str
+    use_cache: bool = True
 
 
 class VoiceCloneGenerateResponse(BaseModel):
     audio_url: str
+
+
+class VoiceStreamStatusResponse(BaseModel):
+    stream_id: str
+    status: str
+    audio_url: str | None = None
+    error: str | None = None
@@ -0,0 +1,69 @@
+import logging
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from app.config import get_settings
+from app.services import ffmpeg_pool
+from app.services.cache import FileCache, get_file_cache, make_key
+from app.services.storage import get_storage
+from app.services.url_resolver import cached_download, local_upload_path
+
+logger = logging.getLogger(__name__)
+
+# Backgrounds scaled to a video's size, stored as PNG under data_dir. The
+# cache index bounds them by total bytes and evicts the least recently used,
+# deleting the file with the entry.
+
+
+def _scaled_cache() -> FileCache:
+    settings = get_settings()
+    return get_file_cache(
+        "backgrounds",
+        Path(settings.data_dir) / "backgrounds",
+        max_entries=settings.background_cache_max_entries,
+        max_bytes=settings.background_cache_max_bytes,
+    )
+
+
+@asynccontextmanager
+async def _source(background_url: str):
+    # Yields the background's content hash and where it is on disk. Remote
+    # backgrounds go to the bounded download cache, not the uploads store.
+    path = local_upload_path(background_url)
+    if path is not None:
+        yield await get_storage().content_hash(path), path
+        return
+    suffix = Path(background_url.split("?")[0]).suffix or ".jpg"
+    async with cached_download(background_url, suffix) as source:
+        yield source
+
+
+async def _render(key: str, source_path: Path, width: int, height: int, priority: int) -> dict:
+    cache = _scaled_cache()
+    with cache.writing(".png") as tmp_path:
+        await ffmpeg_pool.run([
+            "ffmpeg", "-y",
+            "-i", str(source_path),
+            "-vf", f"scale={width}:{height},setsar=1",
+            "-frames:v", "1",
+            str(tmp_path),
+        ], priority)
+        return await cache.store(key, tmp_path, f"{key}.png")
+
+
+@asynccontextmanager
+async def scaled_background(
+    background_url: str,
+    width: int,
+    height: int,
+    priority: int = ffmpeg_pool.PRIORITY_NORMAL,
+):
+    # Yields the scaled PNG, pinned so eviction can't delete it mid-render
+    cache = _scaled_cache()
+    async with _source(background_url) as (sha256, source_path):
+        key = make_key(sha256, f"{width}x{height}")
+        with cache.pinned(f"{key}.png") as path:
+            if await cache.lookup(key) is None:
+                logger.info(f"Scaling background {sha256[:12]} to {width}x{height}")
+                await cache.single_flight(key, lambda: _render(key, source_path, width, height, priority))
+            yield path
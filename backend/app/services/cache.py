@@ -0,0 +1,319 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import AsyncExitStack, closing, contextmanager
+from pathlib import Path
+from typing import Awaitable, Callable, Iterator
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import get_settings
+
+_caches: dict[str, "ResultCache"] = {}
+
+
+def make_key(*parts) -> str:
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+# Persistent key -> JSON value cache backed by one SQLite file in data_dir,
+# with an optional in-memory LRU in front. Entries are evicted by age, then
+# least-recently-used first until both the entry and byte limits hold.
+class ResultCache:
+    def __init__(
+        self,
+        name: str,
+        max_entries: int,
+        max_age: float | None = None,
+        max_bytes: int | None = None,
+        memory_entries: int = 0,
+        on_evict: Callable[[dict], None] | None = None,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._pending: dict[str, asyncio.Task] = {}
+
+        settings = get_settings()
+        data_dir = Path(settings.data_dir)
+        data_dir.mkdir(parents=True, exist_ok=True)
+        self.db_path = data_dir / "cache.sqlite"
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS entries (
+                    cache TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL,
+                    PRIMARY KEY (cache, key)
+                )"""
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=10.0)
+
+    def _remember(self, key: str, value: dict, created_at: float):
+        if not self.memory_entries:
+            return
+        self._memory[key] = (created_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def _get_memory(self, key: str) -> dict | None:
+        # Memory hits skip SQLite entirely (and so don't refresh the on-disk
+        # recency, which only matters once they fall out of memory)
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None or (self.max_age is not None and time.time() - entry[0] > self.max_age):
+                return None
+            self._memory.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def get_sync(self, key: str) -> dict | None:
+        value = self._get_memory(key)
+        if value is not None:
+            return value
+
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT value, created_at FROM entries WHERE cache = ? AND key = ?",
+                (self.name, key),
+            ).fetchone()
+            if row is not None and self.max_age is not None and now - row[1] > self.max_age:
+                row = None
+            if row is not None:
+                conn.execute(
+                    "UPDATE entries SET last_used_at = ? WHERE cache = ? AND key = ?",
+                    (now, self.name, key),
+                )
+
+        with self._lock:
+            if row is None:
+                self._memory.pop(key, None)
+                self.misses += 1
+                return None
+            self.hits += 1
+            value = json.loads(row[0])
+            self._remember(key, value, row[1])
+            return value
+
+    def set_sync(self, key: str, value: dict, size: int = 0):
+        if self.max_bytes is not None and size > self.max_bytes:
+            # It could never fit, and admitting it would only push out every
+            # other entry and then itself
+            self.delete_sync(key)
+            if self.on_evict:
+                self.on_evict(value)
+            return
+
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                (self.name, key, json.dumps(value), size, now, now),
+            )
+            evicted = self._evict(conn, now, key)
+        with self._lock:
+            self._remember(key, value, now)
+            for evicted_key, _ in evicted:
+                self._memory.pop(evicted_key, None)
+            self.evictions += len(evicted)
+        if self.on_evict:
+            for _, evicted_value in evicted:
+                self.on_evict(evicted_value)
+
+    def delete_sync(self, key: str):
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM entries WHERE cache = ? AND key = ?", (self.name, key))
+        with self._lock:
+            self._memory.pop(key, None)
+
+    def _evict(self, conn: sqlite3.Connection, now: float, keep: str) -> list[tuple[str, dict]]:
+        # `keep` is the entry just set, which is never its own victim
+        victims = []
+        if self.max_age is not None:
+            victims += conn.execute(
+                "SELECT key, value FROM entries WHERE cache = ? AND created_at < ?",
+                (self.name, now - self.max_age),
+            ).fetchall()
+
+        count, total = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE cache = ? AND created_at >= ?",
+            (self.name, now - self.max_age if self.max_age is not None else 0),
+        ).fetchone()
+        if count > self.max_entries or (self.max_bytes is not None and total > self.max_bytes):
+            rows = conn.execute(
+                "SELECT key, value, size FROM entries WHERE cache = ? AND created_at >= ? ORDER BY last_used_at",
+                (self.name, now - self.max_age if self.max_age is not None else 0),
+            )
+            for key, value, size in rows:
+                if count <= self.max_entries and (self.max_bytes is None or total <= self.max_bytes):
+                    break
+                if key == keep:
+                    continue
+                victims.append((key, value))
+                count -= 1
+                total -= size
+
+        conn.executemany(
+            "DELETE FROM entries WHERE cache = ? AND key = ?",
+            [(self.name, key) for key, _ in victims],
+        )
+        return [(key, json.loads(value)) for key, value in victims]
+
+    async def get(self, key: str) -> dict | None:
+        value = self._get_memory(key)
+        if value is not None:
+            return value
+        return await run_in_threadpool(self.get_sync, key)
+
+    async def set(self, key: str, value: dict, size: int = 0):
+        await run_in_threadpool(self.set_sync, key, value, size)
+
+    async def delete(self, key: str):
+        await run_in_threadpool(self.delete_sync, key)
+
+    async def single_flight(self, key: str, compute: Callable[[], Awaitable]):
+        # Concurrent misses for the same key share one computation. Shielded
+        # so one caller going away doesn't cancel it for the others.
+        task = self._pending.get(key)
+        if task is None:
+            task = asyncio.create_task(compute())
+            self._pending[key] = task
+            task.add_done_callback(lambda _: self._pending.pop(key, None))
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        with closing(self._connect()) as conn:
+            count, total = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries WHERE cache = ?",
+                (self.name,),
+            ).fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "name": self.name,
+            "entries": count,
+            "bytes": total,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+# A ResultCache whose entries are files in one directory. Each value holds
+# the file's "path"; files are written under a temp name and renamed in, and
+# evicting an entry deletes its file unless a caller still has it pinned, in
+# which case it goes when the last pin is released.
+class FileCache(ResultCache):
+    def __init__(self, name: str, directory: Path, **kwargs):
+        super().__init__(name, on_evict=self._remove, **kwargs)
+        self.directory = directory
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._pins: dict[str, int] = {}
+        self._orphans: set[str] = set()
+
+    def _remove(self, value: dict):
+        with self._lock:
+            if value["path"] in self._pins:
+                self._orphans.add(value["path"])
+                return
+        Path(value["path"]).unlink(missing_ok=True)
+
+    @contextmanager
+    def pinned(self, name: str) -> Iterator[Path]:
+        # Pin before looking the entry up, so it can't be evicted in between
+        path = str(self.directory / name)
+        with self._lock:
+            self._pins[path] = self._pins.get(path, 0) + 1
+        try:
+            yield Path(path)
+        finally:
+            orphaned = False
+            with self._lock:
+                self._pins[path] -= 1
+                if not self._pins[path]:
+                    del self._pins[path]
+                    orphaned = path in self._orphans
+                    self._orphans.discard(path)
+            if orphaned:
+                Path(path).unlink(missing_ok=True)
+
+    async def lookup(self, key: str) -> dict | None:
+        value = await self.get(key)
+        if value is not None and Path(value["path"]).exists():
+            return value
+        return None
+
+    def temp_path(self, suffix: str) -> Path:
+        # Leading dot: media.probe doesn't cache files about to be renamed
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, prefix=f".{self.name}-", suffix=suffix)
+        os.close(fd)
+        return Path(tmp_name)
+
+    @contextmanager
+    def writing(self, suffix: str) -> Iterator[Path]:
+        # Temp file for the caller to fill and store(); removed if it wasn't
+        path = self.temp_path(suffix)
+        try:
+            yield path
+        finally:
+            path.unlink(missing_ok=True)
+
+    async def store(self, key: str, source: Path, name: str, **fields) -> dict:
+        # Callers that go on using the file should hold pinned(name): an entry
+        # over max_bytes is not kept, and only a pin keeps its file around
+        path = self.directory / name
+        os.replace(source, path)
+        with self._lock:
+            self._orphans.discard(str(path))
+        value = {"path": str(path), **fields}
+        await self.set(key, value, size=path.stat().st_size)
+        return value
+
+
+async def enter_all(stack: AsyncExitStack, managers) -> list:
+    # Enters async context managers (e.g. pinned cache files) concurrently.
+    # Every one that did enter is on the stack even if another failed, so
+    # leaving the stack releases them all.
+    results = await asyncio.gather(
+        *(stack.enter_async_context(manager) for manager in managers), return_exceptions=True,
+    )
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+def get_cache(name: str, **kwargs) -> ResultCache:
+    if name not in _caches:
+        _caches[name] = ResultCache(name, **kwargs)
+    return _caches[name]
+
+
+def get_file_cache(name: str, directory: Path, **kwargs) -> FileCache:
+    if name not in _caches:
+        _caches[name] = FileCache(name, directory, **kwargs)
+    return _caches[name]
+
+
+def all_stats() -> list[dict]:
+    return [cache.stats() for cache in _caches.values()]
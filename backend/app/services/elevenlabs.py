@@ -1,58 +1,213 @@
+import asyncio
+import hashlib
+import logging
 import uuid
 import aiofiles
-from io import BytesIO
+from collections import OrderedDict
 from pathlib import Path
+from typing import AsyncIterator
 from fastapi.concurrency import run_in_threadpool
-from elevenlabs.client import ElevenLabs
+from elevenlabs.client import AsyncElevenLabs, ElevenLabs
+from elevenlabs.core.api_error import ApiError
 
+from app import clients
 from app.config import get_settings
+from app.services import voice_registry
+from app.services.cache import get_cache, make_key
+from app.services.storage import get_storage
+from app.services.url_resolver import local_upload_path
 
+logger = logging.getLogger(__name__)
 
-def _get_client() -> ElevenLabs:
-    settings = get_settings()
-    return ElevenLabs(api_key=settings.elevenlabs_api_key)
+MODEL_ID = "eleven_multilingual_v2"
+OUTPUT_FORMAT = "mp3_44100_128"
 
-
-def clone_voice_sync(audio_bytes: bytes, name: str) -> str:
-    client = _get_client()
-    voice = client.voices.ivc.create(
-        name=name,
-        files=[BytesIO(audio_bytes)]
-    )
-    return voice.voice_id
+# Recent streams by id, so the final URL can be looked up once a stream ends
+_streams: OrderedDict[str, dict] = OrderedDict()
+_stream_tasks: set[asyncio.Task] = set()
+# Serializes cloning so the registry count stays accurate while making room
+_clone_lock = asyncio.Lock()
 
 
-def generate_speech_sync(voice_id: str, text: str) -> bytes:
-    client = _get_client()
-    audio_generator = client.text_to_speech.convert(
-        voice_id=voice_id,
-        text=text,
-        model_id="eleven_multilingual_v2",
-        output_format="mp3_44100_128"
-    )
-    audio_bytes = b"".join(audio_generator)
-    return audio_bytes
+def _get_client() -> ElevenLabs:
+    return clients.elevenlabs_client()
 
 
-async def clone_voice(audio_bytes: bytes, name: str) -> str:
-    return await run_in_threadpool(clone_voice_sync, audio_bytes, name)
+def _get_async_client() -> AsyncElevenLabs:
+    return clients.elevenlabs_async_client()
 
 
-async def generate_speech(voice_id: str, text: str) -> str:
-    audio_bytes = await run_in_threadpool(generate_speech_sync, voice_id, text)
-    audio_url = await _save_audio(audio_bytes)
-    return audio_url
+def clone_voice_sync(audio_path: Path, name: str) -> str:
+    client = _get_client()
+    with open(audio_path, "rb") as f:
+        voice = client.voices.ivc.create(
+            name=name,
+            files=[f]
+        )
+    return voice.voice_id
 
 
-async def _save_audio(audio_bytes: bytes) -> str:
+async def clone_voice(audio_path: Path, name: str) -> str:
+    return await run_in_threadpool(clone_voice_sync, audio_path, name)
+
+
+async def delete_voice(voice_id: str):
+    await _get_async_client().voices.delete(voice_id)
+
+
+async def _make_room():
+    # Deletes least recently used cloned voices until one more fits under the
+    # configured limit. A voice already gone upstream is just forgotten; any
+    # other failure stops eviction and leaves the entry for next time.
+    excess = await voice_registry.count() - get_settings().elevenlabs_max_cloned_voices + 1
+    if excess <= 0:
+        return
+    for voice_id in await voice_registry.least_recently_used(excess):
+        try:
+            await delete_voice(voice_id)
+        except ApiError as e:
+            if e.status_code != 404:
+                logger.warning(f"Failed to delete voice {voice_id}: {e}")
+                return
+        await voice_registry.forget(voice_id)
+        logger.info(f"Deleted least recently used voice {voice_id}")
+
+
+async def get_or_clone_voice(audio_path: Path, audio_sha256: str) -> str:
+    # The same recording always maps to the same voice; only new audio is
+    # cloned, after evicting old voices if we're at the limit
+    voice_id = await voice_registry.lookup(audio_sha256)
+    if voice_id is not None:
+        logger.info(f"Reusing voice {voice_id} for audio {audio_sha256[:12]}")
+        return voice_id
+
+    async with _clone_lock:
+        voice_id = await voice_registry.lookup(audio_sha256)
+        if voice_id is not None:
+            return voice_id
+        await _make_room()
+        name = f"clone_{audio_sha256[:8]}"
+        voice_id = await clone_voice(audio_path, name)
+        await voice_registry.register(audio_sha256, voice_id, name)
+        return voice_id
+
+
+def _speech_cache():
     settings = get_settings()
-    upload_dir = Path(settings.upload_dir)
-    upload_dir.mkdir(exist_ok=True)
-
-    filename = f"{uuid.uuid4()}.mp3"
-    filepath = upload_dir / filename
+    return get_cache(
+        "speech_elevenlabs",
+        max_entries=settings.tts_cache_max_entries,
+        max_age=settings.tts_cache_max_age,
+    )
 
-    async with aiofiles.open(filepath, "wb") as f:
-        await f.write(audio_bytes)
 
-    return f"/uploads/{filename}"
+def _speech_cache_key(voice_id: str, text: str) -> str:
+    return make_key("elevenlabs", voice_id, " ".join(text.split()), MODEL_ID, OUTPUT_FORMAT)
+
+
+async def _cached_speech(voice_id: str, text: str) -> str | None:
+    cached = await _speech_cache().get(_speech_cache_key(voice_id, text))
+    if cached is not None and local_upload_path(cached["audio_url"]) is not None:
+        logger.info(f"Speech cache hit for voice {voice_id}")
+        # Still counts as using the voice, so it isn't evicted while in demand
+        await voice_registry.touch(voice_id)
+        return cached["audio_url"]
+    return None
+
+
+async def _speak(voice_id: str, text: str, queue: asyncio.Queue | None = None) -> str:
+    # Writes the audio to storage chunk by chunk as ElevenLabs streams it,
+    # passing each chunk on to `queue` if given, and returns the stored URL
+    await voice_registry.touch(voice_id)
+    digest = hashlib.sha256()
+    with get_storage().scratch(".mp3") as tmp_path:
+        audio_stream = _get_async_client().text_to_speech.stream(
+            voice_id=voice_id,
+            text=text,
+            model_id=MODEL_ID,
+            output_format=OUTPUT_FORMAT,
+        )
+        async with aiofiles.open(tmp_path, "wb") as f:
+            async for chunk in audio_stream:
+                digest.update(chunk)
+                await f.write(chunk)
+                if queue is not None:
+                    queue.put_nowait(chunk)
+        blob = await get_storage().put_file(tmp_path, ".mp3", digest.hexdigest())
+
+    await _speech_cache().set(_speech_cache_key(voice_id, text), {"audio_url": blob["url"]})
+    return blob["url"]
+
+
+async def generate_speech(voice_id: str, text: str, use_cache: bool = True) -> str:
+    if use_cache:
+        cached = await _cached_speech(voice_id, text)
+        if cached is not None:
+            return cached
+    return await _speak(voice_id, text)
+
+
+def _remember(stream: dict):
+    _streams[stream["id"]] = stream
+    while len(_streams) > get_settings().tts_stream_registry_size:
+        _streams.popitem(last=False)
+
+
+async def _produce(stream: dict, voice_id: str, text: str, queue: asyncio.Queue):
+    try:
+        stream["audio_url"] = await _speak(voice_id, text, queue)
+        stream["status"] = "succeeded"
+    except Exception as e:
+        logger.error(f"Speech stream {stream['id']} failed: {str(e)}")
+        stream["status"] = "failed"
+        stream["error"] = str(e)
+        queue.put_nowait(e)
+    finally:
+        queue.put_nowait(None)
+
+
+async def _read_file(path: Path, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    async with aiofiles.open(path, "rb") as f:
+        while chunk := await f.read(chunk_size):
+            yield chunk
+
+
+async def stream_speech(
+    voice_id: str,
+    text: str,
+    use_cache: bool = True,
+) -> tuple[str, AsyncIterator[bytes]]:
+    # Starts synthesis and returns (stream id, audio chunks) once the first
+    # chunk is in. Synthesis and the write to storage carry on even if the
+    # listener goes away, so the finished file is still there for lip-sync.
+    stream = {"id": uuid.uuid4().hex, "status": "streaming", "audio_url": None, "error": None}
+    if use_cache:
+        cached = await _cached_speech(voice_id, text)
+        if cached is not None:
+            stream.update(status="succeeded", audio_url=cached)
+            _remember(stream)
+            return stream["id"], _read_file(local_upload_path(cached))
+
+    _remember(stream)
+    queue: asyncio.Queue = asyncio.Queue()
+    task = asyncio.create_task(_produce(stream, voice_id, text, queue))
+    _stream_tasks.add(task)
+    task.add_done_callback(_stream_tasks.discard)
+
+    first = await queue.get()
+    if isinstance(first, Exception):
+        raise RuntimeError(str(first))
+
+    async def chunks():
+        item = first
+        while item is not None:
+            if isinstance(item, Exception):
+                raise RuntimeError(str(item))
+            yield item
+            item = await queue.get()
+
+    return stream["id"], chunks()
+
+
+def get_stream(stream_id: str) -> dict | None:
+    return _streams.get(stream_id)
@@ -1,38 +1,22 @@
 import asyncio
-import uuid
-import httpx
-import aiofiles
+import logging
+from contextlib import AsyncExitStack, ExitStack
 from pathlib import Path
 
 from app.config import get_settings
+from app.services import backgrounds, ffmpeg_pool, foregrounds, media, previews
+from app.services.cache import enter_all, make_key
+from app.services.storage import get_storage
+from app.services.url_resolver import resolve_inputs
 
-
-async def download_file(url: str, filepath: Path):
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, timeout=120.0, follow_redirects=True)
-        response.raise_for_status()
-        async with aiofiles.open(filepath, "wb") as f:
-            await f.write(response.content)
+logger = logging.getLogger(__name__)
 
 
 async def get_audio_duration(audio_path: Path) -> float:
-    cmd = [
-        "ffprobe", "-v", "error",
-        "-show_entries", "format=duration",
-        "-of", "default=noprint_wrappers=1:nokey=1",
-        str(audio_path)
-    ]
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    stdout, stderr = await process.communicate()
-    
-    if process.returncode != 0:
-        raise RuntimeError(f"FFprobe failed: {stderr.decode()}")
-    
-    return float(stdout.decode().strip())
+    info = await media.probe(audio_path)
+    if info["duration"] is None:
+        raise RuntimeError(f"No duration for {audio_path.name}")
+    return info["duration"]
 
 
 async def trim_video(video_path: Path, duration: float, output_path: Path):
@@ -44,131 +28,350 @@ async def trim_video(video_path: Path, duration: float, output_path: Path):
         "-c:a", "copy",
         str(output_path),
     ]
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    stdout, stderr = await process.communicate()
-    
-    if process.returncode != 0:
-        raise RuntimeError(f"FFmpeg trim failed: {stderr.decode()}")
+    await ffmpeg_pool.run(cmd)
 
 
-async def get_video_size(video_path: Path) -> tuple[int, int]:
-    cmd = [
-        "ffprobe", "-v", "error",
-        "-select_streams", "v:0",
-        "-show_entries", "stream=width,height",
-        "-of", "default=noprint_wrappers=1:nokey=1",
-        str(video_path)
-    ]
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    stdout, stderr = await process.communicate()
-    
-    if process.returncode != 0:
-        raise RuntimeError(f"FFprobe failed: {stderr.decode()}")
-    
-    lines = stdout.decode().strip().split("\n")
-    width = int(lines[0])
-    height = int(lines[1])
-    return (width, height)
+async def get_video_size(video_path: Path) -> tuple[int, int, str]:
+    # Returns (width, height, frame rate as ffprobe's "num/den" string)
+    video = (await media.probe(video_path))["video"]
+    if video is None:
+        raise RuntimeError(f"No video stream in {video_path.name}")
+    return (video["width"], video["height"], video["r_frame_rate"])
 
 
-async def merge_audio_video(video_url: str, audio_url: str) -> str:
+def encoder_profile(name: str | None = None) -> dict:
     settings = get_settings()
-    upload_dir = Path(settings.upload_dir)
-    upload_dir.mkdir(exist_ok=True)
-
-    merge_id = str(uuid.uuid4())
-    video_path = upload_dir / f"{merge_id}_video.mp4"
-    audio_path = upload_dir / f"{merge_id}_audio.mp3"
-    trimmed_video_path = upload_dir / f"{merge_id}_trimmed.mp4"
-    output_path = upload_dir / f"{merge_id}_merged.mp4"
-
-    await asyncio.gather(
-        download_file(video_url, video_path),
-        download_file(audio_url, audio_path),
-    )
+    name = name or settings.default_encoder_profile
+    profile = settings.encoder_profiles.get(name)
+    if profile is None:
+        raise ValueError(f"Unknown encoder profile: {name}")
+    return profile
+
+
+def _even(value: float) -> int:
+    return max(2, int(value) // 2 * 2)
+
+
+def composite_geometry(width: int, height: int, scale: float, max_height: int | None = None) -> dict:
+    # Output size (optionally downscaled for previews) and where the keyed
+    # foreground sits: scaled by `scale`, centred, standing on the bottom edge
+    if max_height and height > max_height:
+        width = _even(width * max_height / height)
+        height = _even(max_height)
+    fg_width = int(width * scale)
+    fg_height = int(height * scale)
+    return {
+        "width": width,
+        "height": height,
+        "fg_width": fg_width,
+        "fg_height": fg_height,
+        "x": (width - fg_width) // 2,
+        "y": height - fg_height,
+    }
+
+
+def _encoder_args(profile: dict) -> list[str]:
+    args = [
+        "-c:v", "libx264",
+        "-preset", profile["preset"],
+        "-crf", str(profile["crf"]),
+        "-pix_fmt", "yuv420p",
+    ]
+    if profile.get("faststart"):
+        args += ["-movflags", "+faststart"]
+    return args
+
+
+def _composite_filter(
+    geometry: dict,
+    key: dict | None,
+    outputs: int = 1,
+    keep_foreground: bool = False,
+    prescaled: bool = True,
+) -> str:
+    # Input 0 is the video, inputs 1..outputs the background stills, and the
+    # composites come out as [out0], [out1], ... Each still is decoded once
+    # (and scaled, unless it already is the output size), then repeated by the
+    # loop filter at the video's frame rate. The foreground is keyed after it
+    # is scaled down, so chromakey only touches pixels that end up in the
+    # output. With key=None input 0 is a stored foreground that already has
+    # alpha; keep_foreground adds a [keyed] output so it can be stored.
+    g = geometry
+    background = "format=yuv420p" if prescaled else f"scale={g['width']}:{g['height']},setsar=1,format=yuv420p"
+    foreground = foregrounds.key_filter(g, key) if key else "null"
+    labels = [f"[fg{i}]" for i in range(outputs)] + (["[keyed]"] if keep_foreground else [])
+    graph = [f"[0:v]{foreground},split={len(labels)}{''.join(labels)}"]
+    for i in range(outputs):
+        graph.append(f"[{i + 1}:v]{background},loop=loop=-1:size=1[bg{i}]")
+        graph.append(f"[bg{i}][fg{i}]overlay={g['x']}:{g['y']}:shortest=1[out{i}]")
+    return ";".join(graph)
+
+
+def _composite_inputs(
+    video_path: Path,
+    background_paths: list[Path],
+    frame_rate: str,
+    start: float = 0.0,
+) -> list[str]:
+    args = ["-ss", str(start)] if start else []
+    args += ["-i", str(video_path)]
+    for background_path in background_paths:
+        args += ["-framerate", frame_rate, "-i", str(background_path)]
+    return args
+
+
+def _composite_command(
+    video_path: Path,
+    background_paths: list[Path],
+    geometry: dict,
+    frame_rate: str,
+    profile: dict,
+    output_paths: list[Path],
+    key: dict | None,
+    keep_foreground: Path | None = None,
+    prescaled: bool = True,
+) -> list[str]:
+    # The outputs share the pool slot's thread budget
+    threads = max(1, ffmpeg_pool.threads_per_job() // (len(output_paths) + bool(keep_foreground)))
+    outputs = []
+    for i, output_path in enumerate(output_paths):
+        outputs += [
+            "-map", f"[out{i}]",
+            "-map", "0:a?",
+            *_encoder_args(profile),
+            "-threads", str(threads),
+            "-c:a", "copy",
+            "-shortest",
+            str(output_path),
+        ]
+    if keep_foreground:
+        outputs += [
+            "-map", "[keyed]",
+            "-map", "0:a?",
+            *foregrounds.ENCODER_ARGS,
+            "-threads", str(threads),
+            "-c:a", "copy",
+            str(keep_foreground),
+        ]
+    return [
+        "ffmpeg", "-y",
+        *_composite_inputs(video_path, background_paths, frame_rate),
+        "-filter_complex", _composite_filter(
+            geometry, key, len(output_paths), keep_foreground is not None, prescaled,
+        ),
+        *outputs,
+    ]
 
-    audio_duration = await get_audio_duration(audio_path)
-    await trim_video(video_path, audio_duration, trimmed_video_path)
 
+def _merge_command(video_path: Path, audio_path: Path, output: Path | None = None) -> list[str]:
+    # One pass: video is stream-copied, audio encoded, and -shortest ends
+    # the output with the shorter input instead of trimming beforehand
     cmd = [
         "ffmpeg", "-y",
-        "-i", str(trimmed_video_path),
+        "-i", str(video_path),
         "-i", str(audio_path),
+        "-map", "0:v:0",
+        "-map", "1:a:0",
         "-c:v", "copy",
         "-c:a", "aac",
-        str(output_path),
+        "-shortest",
     ]
+    if output is None:
+        # A pipe can't be seeked back to write the moov atom, so emit a
+        # fragmented mp4 instead
+        return cmd + ["-movflags", "frag_keyframe+empty_moov", "-f", "mp4", "pipe:1"]
+    return cmd + [str(output)]
+
+
+async def mux_audio_video(
+    video_path: Path,
+    audio_path: Path,
+    output_path: Path,
+    priority: int = ffmpeg_pool.PRIORITY_NORMAL,
+):
+    await ffmpeg_pool.run(_merge_command(video_path, audio_path, output_path), priority)
 
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
-    )
-    stdout, stderr = await process.communicate()
+
+async def stream_audio_video(
+    video_path: Path,
+    audio_path: Path,
+    chunk_size: int = 64 * 1024,
+    priority: int = ffmpeg_pool.PRIORITY_NORMAL,
+):
+    # Yields the merged mp4 straight from ffmpeg's stdout, nothing is written to disk
+    async with ffmpeg_pool.spawn(_merge_command(video_path, audio_path), priority) as process:
+        stderr_task = asyncio.create_task(process.stderr.read())
+        try:
+            while chunk := await process.stdout.read(chunk_size):
+                yield chunk
+            await process.wait()
+        finally:
+            if process.returncode is None:
+                stderr_task.cancel()
+        stderr = await stderr_task
 
     if process.returncode != 0:
         raise RuntimeError(f"FFmpeg failed: {stderr.decode()}")
 
-    video_path.unlink(missing_ok=True)
-    audio_path.unlink(missing_ok=True)
-    trimmed_video_path.unlink(missing_ok=True)
 
-    return f"/uploads/{merge_id}_merged.mp4"
+async def _trim_then_mux(
+    video_path: Path,
+    audio_path: Path,
+    output_path: Path,
+    priority: int = ffmpeg_pool.PRIORITY_NORMAL,
+):
+    with get_storage().scratch(".mp4") as trimmed_video_path:
+        audio_duration = await get_audio_duration(audio_path)
+        await trim_video(video_path, audio_duration, trimmed_video_path)
 
+        cmd = [
+            "ffmpeg", "-y",
+            "-i", str(trimmed_video_path),
+            "-i", str(audio_path),
+            "-c:v", "copy",
+            "-c:a", "aac",
+            str(output_path),
+        ]
+        await ffmpeg_pool.run(cmd, priority)
 
-async def replace_greenscreen(video_url: str, background_url: str, scale: float = 0.6) -> str:
-    settings = get_settings()
-    upload_dir = Path(settings.upload_dir)
-    upload_dir.mkdir(exist_ok=True)
 
-    replace_id = str(uuid.uuid4())
-    video_path = upload_dir / f"{replace_id}_video.mp4"
-    background_path = upload_dir / f"{replace_id}_background.jpg"
-    output_path = upload_dir / f"{replace_id}_final.mp4"
+async def stream_merge(
+    video_url: str,
+    audio_url: str,
+    priority: int = ffmpeg_pool.PRIORITY_NORMAL,
+):
+    # merge_audio_video without the output file: fragmented mp4 chunks are
+    # yielded as ffmpeg writes them
+    async with resolve_inputs((video_url, ".mp4"), (audio_url, ".mp3")) as ((video_path, _), (audio_path, _)):
+        async for chunk in stream_audio_video(video_path, audio_path, priority=priority):
+            yield chunk
 
-    await asyncio.gather(
-        download_file(video_url, video_path),
-        download_file(background_url, background_path),
-    )
 
-    width, height = await get_video_size(video_path)
-    
-    fg_width = int(width * scale)
-    fg_height = int(height * scale)
-    overlay_x = (width - fg_width) // 2
-    overlay_y = height - fg_height
+async def merge_audio_video(
+    video_url: str,
+    audio_url: str,
+    priority: int = ffmpeg_pool.PRIORITY_NORMAL,
+) -> str:
+    merge = mux_audio_video if get_settings().ffmpeg_single_pass_merge else _trim_then_mux
+
+    with get_storage().scratch(".mp4") as output_path:
+        async with resolve_inputs((video_url, ".mp4"), (audio_url, ".mp3")) as ((video_path, _), (audio_path, _)):
+            await merge(video_path, audio_path, output_path, priority)
+        blob = await get_storage().put_file(output_path, ".mp4")
+    return blob["url"]
 
-    cmd = [
-        "ffmpeg", "-y",
-        "-i", str(video_path),
-        "-loop", "1",
-        "-i", str(background_path),
-        "-filter_complex",
-        f"[1:v]scale={width}:{height}[bg];[0:v]chromakey=0x00FF00:0.3:0.1,scale={fg_width}:{fg_height}[fg];[bg][fg]overlay={overlay_x}:{overlay_y}",
-        "-c:a", "copy",
-        "-shortest",
-        str(output_path),
-    ]
 
-    process = await asyncio.create_subprocess_exec(
-        *cmd,
-        stdout=asyncio.subprocess.PIPE,
-        stderr=asyncio.subprocess.PIPE,
+async def replace_greenscreen(
+    video_url: str,
+    background_url: str,
+    scale: float = 0.6,
+    profile: str | None = None,
+    key_color: str = foregrounds.DEFAULT_KEY_COLOR,
+    key_similarity: float = foregrounds.DEFAULT_SIMILARITY,
+    key_blend: float = foregrounds.DEFAULT_BLEND,
+    priority: int = ffmpeg_pool.PRIORITY_NORMAL,
+) -> str:
+    urls = await replace_greenscreen_batch(
+        video_url, [background_url], scale, profile, key_color, key_similarity, key_blend, priority,
     )
-    stdout, stderr = await process.communicate()
+    return urls[0]
 
-    if process.returncode != 0:
-        raise RuntimeError(f"FFmpeg chromakey failed: {stderr.decode()}")
 
-    video_path.unlink(missing_ok=True)
-    background_path.unlink(missing_ok=True)
+async def replace_greenscreen_batch(
+    video_url: str,
+    background_urls: list[str],
+    scale: float = 0.6,
+    profile: str | None = None,
+    key_color: str = foregrounds.DEFAULT_KEY_COLOR,
+    key_similarity: float = foregrounds.DEFAULT_SIMILARITY,
+    key_blend: float = foregrounds.DEFAULT_BLEND,
+    priority: int = ffmpeg_pool.PRIORITY_NORMAL,
+) -> list[str]:
+    # One ffmpeg process composites the keyed foreground onto every background.
+    # The first render of a video with given key parameters also stores the
+    # keyed foreground; after that renders are overlay-only.
+    encoder = encoder_profile(profile)
+    key = foregrounds.chroma_key(key_color, key_similarity, key_blend)
+    keep_path = None
+
+    with ExitStack() as scratch:
+        output_paths = [scratch.enter_context(get_storage().scratch(".mp4")) for _ in background_urls]
+        async with resolve_inputs((video_url, ".mp4")) as ((video_path, video_hash),), AsyncExitStack() as pinned:
+            width, height, frame_rate = await get_video_size(video_path)
+            geometry = composite_geometry(width, height, scale, encoder.get("max_height"))
+            background_paths = await enter_all(pinned, (
+                backgrounds.scaled_background(url, geometry["width"], geometry["height"], priority)
+                for url in background_urls
+            ))
+
+            cache_key = await foregrounds.cache_key(video_path, geometry, key, video_hash)
+            stored_path = await pinned.enter_async_context(foregrounds.stored(cache_key))
+            if stored_path is None:
+                keep_path = scratch.enter_context(foregrounds.writing())
+                cmd = _composite_command(
+                    video_path, background_paths, geometry, frame_rate, encoder, output_paths, key, keep_path,
+                )
+            else:
+                cmd = _composite_command(
+                    stored_path, background_paths, geometry, frame_rate, encoder, output_paths, None,
+                )
+            await ffmpeg_pool.run(cmd, priority)
+
+        if keep_path is not None:
+            await foregrounds.store(cache_key, keep_path)
+
+        urls = []
+        for output_path in output_paths:
+            blob = await get_storage().put_file(output_path, ".mp4")
+            urls.append(blob["url"])
+    return urls
+
+
+async def render_preview(
+    video_url: str,
+    background_url: str,
+    scale: float = 0.6,
+    mode: str = "still",
+    timestamp: float = 0.0,
+    duration: float = 2.0,
+    key_color: str = foregrounds.DEFAULT_KEY_COLOR,
+    key_similarity: float = foregrounds.DEFAULT_SIMILARITY,
+    key_blend: float = foregrounds.DEFAULT_BLEND,
+    priority: int = ffmpeg_pool.PRIORITY_HIGH,
+) -> str:
+    # Same geometry and filter graph as replace_greenscreen, at preview size:
+    # either one PNG frame at `timestamp` or a short silent clip from there
+    max_height = get_settings().preview_max_height
+    key = foregrounds.chroma_key(key_color, key_similarity, key_blend)
+    ext = ".png" if mode == "still" else ".mp4"
+
+    async with resolve_inputs((video_url, ".mp4")) as ((video_path, video_hash),), AsyncExitStack() as pinned:
+        width, height, frame_rate = await get_video_size(video_path)
+        geometry = composite_geometry(width, height, scale, max_height)
+        background_path = await pinned.enter_async_context(backgrounds.scaled_background(
+            background_url, geometry["width"], geometry["height"], priority,
+        ))
+        # The scaled background's name already identifies its content and size
+        cache_key = make_key(
+            video_hash or await get_storage().content_hash(video_path), background_path.stem,
+            geometry, key, mode, timestamp, duration if mode == "clip" else None,
+        )
+        cached_url = await previews.lookup(cache_key)
+        if cached_url is not None:
+            return cached_url
 
-    return f"/uploads/{replace_id}_final.mp4"
+        if mode == "still":
+            output_args = ["-frames:v", "1"]
+        else:
+            output_args = ["-t", str(duration), *_encoder_args(encoder_profile("preview")), "-an"]
+        with previews.writing(ext) as output_path:
+            cmd = [
+                "ffmpeg", "-y",
+                *_composite_inputs(video_path, [background_path], frame_rate, timestamp),
+                "-filter_complex", _composite_filter(geometry, key),
+                "-map", "[out0]",
+                *output_args,
+                str(output_path),
+            ]
+            await ffmpeg_pool.run(cmd, priority)
+            return await previews.store(cache_key, output_path, ext)
@@ -0,0 +1,164 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+
+from app.config import get_settings
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 10
+PRIORITY_LOW = 20
+
+
+class FFmpegQueueTimeout(RuntimeError):
+    pass
+
+
+_waiters: list[tuple[int, int, asyncio.Future]] = []
+_sequence = itertools.count()
+_running = 0
+_stats = {
+    "started": 0,
+    "succeeded": 0,
+    "failed": 0,
+    "cancelled": 0,
+    "queue_timeouts": 0,
+    "wait_seconds": 0.0,
+    "run_seconds": 0.0,
+    "max_queue_depth": 0,
+}
+
+
+def _cpu_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def threads_per_job() -> int:
+    return max(1, get_settings().ffmpeg_threads_per_job)
+
+
+def max_processes() -> int:
+    # Enough processes to keep every core busy without oversubscribing them
+    configured = get_settings().ffmpeg_max_processes
+    if configured > 0:
+        return configured
+    return max(1, _cpu_count() // threads_per_job())
+
+
+def _wake_next():
+    global _running
+    while _waiters and _running < max_processes():
+        _, _, waiter = heapq.heappop(_waiters)
+        if not waiter.done():
+            _running += 1
+            waiter.set_result(None)
+
+
+@asynccontextmanager
+async def slot(priority: int = PRIORITY_NORMAL, timeout: float | None = None):
+    # Holds one of the pool's process slots; yields the thread count the
+    # ffmpeg run in this slot should use
+    global _running
+    if timeout is None:
+        timeout = get_settings().ffmpeg_queue_timeout or None
+
+    queued_at = time.monotonic()
+    waiter = asyncio.get_running_loop().create_future()
+    heapq.heappush(_waiters, (priority, next(_sequence), waiter))
+    _wake_next()
+    if not waiter.done():
+        _stats["max_queue_depth"] = max(_stats["max_queue_depth"], len(_waiters))
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was handed over just as we gave up on it
+                _running -= 1
+                _wake_next()
+            else:
+                waiter.cancel()
+            if isinstance(e, asyncio.TimeoutError):
+                _stats["queue_timeouts"] += 1
+                raise FFmpegQueueTimeout(f"FFmpeg queue wait exceeded {timeout:g}s")
+            raise
+
+    _stats["wait_seconds"] += time.monotonic() - queued_at
+    try:
+        yield threads_per_job()
+    finally:
+        _running -= 1
+        _wake_next()
+
+
+def with_threads(cmd: list[str], threads: int) -> list[str]:
+    # cmd is a full ffmpeg argv whose last argument is the output; commands
+    # with several outputs set -threads per output themselves
+    if "-threads" in cmd:
+        return [cmd[0], "-filter_threads", str(threads), *cmd[1:]]
+    return [cmd[0], "-filter_threads", str(threads), *cmd[1:-1], "-threads", str(threads), cmd[-1]]
+
+
+@asynccontextmanager
+async def spawn(
+    cmd: list[str],
+    priority: int = PRIORITY_NORMAL,
+    timeout: float | None = None,
+):
+    # Starts ffmpeg in a pool slot. If the process is still running when the
+    # block exits (the caller was cancelled, e.g. the client disconnected)
+    # it is killed so the slot is really free again.
+    async with slot(priority, timeout) as threads:
+        started = time.monotonic()
+        _stats["started"] += 1
+        process = await asyncio.create_subprocess_exec(
+            *with_threads(cmd, threads),
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            yield process
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+                _stats["cancelled"] += 1
+                logger.info(f"Killed ffmpeg process {process.pid}")
+            elif process.returncode == 0:
+                _stats["succeeded"] += 1
+            else:
+                _stats["failed"] += 1
+            _stats["run_seconds"] += time.monotonic() - started
+
+
+async def run(
+    cmd: list[str],
+    priority: int = PRIORITY_NORMAL,
+    timeout: float | None = None,
+) -> tuple[bytes, bytes]:
+    async with spawn(cmd, priority, timeout) as process:
+        stdout, stderr = await process.communicate()
+
+    if process.returncode != 0:
+        raise RuntimeError(f"FFmpeg failed: {stderr.decode()}")
+    return stdout, stderr
+
+
+def stats() -> dict:
+    return {
+        "max_processes": max_processes(),
+        "threads_per_job": threads_per_job(),
+        "running": _running,
+        "queue_depth": sum(1 for _, _, waiter in _waiters if not waiter.done()),
+        **_stats,
+        "avg_wait_seconds": _stats["wait_seconds"] / _stats["started"] if _stats["started"] else 0.0,
+        "avg_run_seconds": _stats["run_seconds"] / _stats["started"] if _stats["started"] else 0.0,
+    }
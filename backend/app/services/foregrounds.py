@@ -0,0 +1,76 @@
+import logging
+import re
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from app.config import get_settings
+from app.services.cache import FileCache, get_file_cache, make_key
+from app.services.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# Chroma-keyed foregrounds (video with alpha plus the source audio) kept under
+# data_dir so changing the background is an overlay-only render. Keyed by the
+# source video's content hash, the key parameters and the foreground size,
+# bounded by disk use with least-recently-used eviction.
+
+DEFAULT_KEY_COLOR = "0x00FF00"
+DEFAULT_SIMILARITY = 0.3
+DEFAULT_BLEND = 0.1
+
+# Lossless, alpha-capable and much cheaper to encode than ProRes 4444
+ENCODER_ARGS = ["-c:v", "ffv1", "-pix_fmt", "yuva420p"]
+EXTENSION = ".mkv"
+
+
+def _cache() -> FileCache:
+    settings = get_settings()
+    return get_file_cache(
+        "foregrounds",
+        Path(settings.data_dir) / "foregrounds",
+        max_entries=settings.foreground_cache_max_entries,
+        max_bytes=settings.foreground_cache_max_bytes,
+    )
+
+
+def chroma_key(
+    color: str = DEFAULT_KEY_COLOR,
+    similarity: float = DEFAULT_SIMILARITY,
+    blend: float = DEFAULT_BLEND,
+) -> dict:
+    match = re.fullmatch(r"(?:0x|#)?([0-9a-fA-F]{6})", color)
+    if match is None:
+        raise ValueError(f"Invalid key color: {color}")
+    return {"color": f"0x{match.group(1).upper()}", "similarity": similarity, "blend": blend}
+
+
+def key_filter(geometry: dict, key: dict) -> str:
+    return (
+        f"scale={geometry['fg_width']}:{geometry['fg_height']},"
+        f"chromakey={key['color']}:{key['similarity']}:{key['blend']}"
+    )
+
+
+async def cache_key(video_path: Path, geometry: dict, key: dict, video_hash: str | None = None) -> str:
+    # Only hashes the video when the caller doesn't already know its digest
+    video_hash = video_hash or await get_storage().content_hash(video_path)
+    return make_key(video_hash, key, geometry["fg_width"], geometry["fg_height"])
+
+
+@asynccontextmanager
+async def stored(cache_key: str):
+    # Yields the stored foreground, if there is one, pinned for the block
+    cache = _cache()
+    with cache.pinned(f"{cache_key}{EXTENSION}") as path:
+        yield path if await cache.lookup(cache_key) is not None else None
+
+
+def writing():
+    return _cache().writing(EXTENSION)
+
+
+async def store(cache_key: str, source: Path) -> Path:
+    entry = await _cache().store(cache_key, source, f"{cache_key}{EXTENSION}")
+    path = Path(entry["path"])
+    logger.info(f"Stored keyed foreground {path.name}")
+    return path
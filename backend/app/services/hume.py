@@ -1,65 +1,158 @@
-import httpx
+import asyncio
 import base64
+import hashlib
+import json
+import logging
 import uuid
-import aiofiles
-from pathlib import Path
+from typing import AsyncIterator
+from fastapi.concurrency import run_in_threadpool
 
+from app import clients
 from app.config import get_settings
+from app.services.cache import get_cache, make_key
+from app.services.storage import get_storage
+from app.services.url_resolver import local_upload_path
+
+logger = logging.getLogger(__name__)
 
 HUME_API_URL = "https://api.hume.ai/v0"
+HUME_TTS_VERSION = "1"
+OUTPUT_FORMAT = "mp3"
+
+
+def _speech_cache():
+    settings = get_settings()
+    return get_cache(
+        "speech_hume",
+        max_entries=settings.tts_cache_max_entries,
+        max_age=settings.tts_cache_max_age,
+    )
+
+
+def _speech_cache_key(text: str, voice_description: str, count: int) -> str:
+    description_hash = hashlib.sha256(" ".join(voice_description.split()).encode()).hexdigest()
+    return make_key("hume", description_hash, " ".join(text.split()), HUME_TTS_VERSION, OUTPUT_FORMAT, count)
+
+
+async def _cached_samples(key: str) -> list[dict] | None:
+    cached = await _speech_cache().get(key)
+    if cached is None:
+        return None
+    if any(local_upload_path(sample["audio_url"]) is None for sample in cached["samples"]):
+        return None
+    logger.info("Hume speech cache hit")
+    return cached["samples"]
 
 
-async def generate_voice_samples(text: str, voice_description: str, count: int = 3) -> list[dict]:
+async def _request_generations(text: str, voice_description: str, count: int) -> bytes:
     settings = get_settings()
     headers = {
         "X-Hume-Api-Key": settings.hume_api_key,
         "Content-Type": "application/json",
     }
 
-    async with httpx.AsyncClient() as client:
-        response = await client.post(
-            f"{HUME_API_URL}/tts",
-            headers=headers,
-            json={
-                "utterances": [
-                    {
-                        "text": text,
-                        "description": voice_description,
-                    }
-                ],
-                "num_generations": count,
-                "version": "1",
-            },
-            timeout=60.0,
-        )
-        response.raise_for_status()
-        data = response.json()
+    client = clients.http("hume")
+    response = await client.post(
+        f"{HUME_API_URL}/tts",
+        headers=headers,
+        json={
+            "utterances": [
+                {
+                    "text": text,
+                    "description": voice_description,
+                }
+            ],
+            "num_generations": count,
+            "version": HUME_TTS_VERSION,
+        },
+        timeout=60.0,
+    )
+    response.raise_for_status()
+    return response.content
 
-    samples = []
-    for generation in data.get("generations", []):
+
+def _decode_generations(body: bytes) -> list[tuple[str, bytes, float]]:
+    # JSON parsing and base64 decoding of the audio are CPU work; callers run
+    # this in the threadpool
+    generations = []
+    for generation in json.loads(body).get("generations", []):
         audio_base64 = generation.get("audio")
         if audio_base64:
-            sample_id = generation.get("generation_id", str(uuid.uuid4()))
-            audio_url = await _save_audio(audio_base64, sample_id)
-            samples.append({
-                "id": sample_id,
-                "audio_url": audio_url,
-                "duration": generation.get("duration", 5.0)
-            })
+            generations.append((
+                generation.get("generation_id", str(uuid.uuid4())),
+                base64.b64decode(audio_base64),
+                generation.get("duration", 5.0),
+            ))
+    return generations
+
+
+async def _save_generations(body: bytes) -> list[dict]:
+    generations = await run_in_threadpool(_decode_generations, body)
+    blobs = await asyncio.gather(*(
+        get_storage().put_bytes(audio_bytes, ".mp3") for _, audio_bytes, _ in generations
+    ))
+    return [
+        {"id": sample_id, "audio_url": blob["url"], "duration": duration}
+        for (sample_id, _, duration), blob in zip(generations, blobs)
+    ]
 
+
+async def generate_voice_samples(
+    text: str,
+    voice_description: str,
+    count: int = 3,
+    use_cache: bool = True,
+) -> list[dict]:
+    key = _speech_cache_key(text, voice_description, count)
+    if use_cache:
+        cached = await _cached_samples(key)
+        if cached is not None:
+            return cached
+
+    body = await _request_generations(text, voice_description, count)
+    samples = await _save_generations(body)
+    if samples:
+        await _speech_cache().set(key, {"samples": samples})
     return samples
 
 
-async def _save_audio(audio_base64: str, sample_id: str) -> str:
-    settings = get_settings()
-    upload_dir = Path(settings.upload_dir)
-    upload_dir.mkdir(exist_ok=True)
+async def stream_voice_samples(
+    text: str,
+    voice_description: str,
+    count: int = 3,
+    use_cache: bool = True,
+) -> AsyncIterator[dict]:
+    # One single-generation request per sample, all in flight at once, so each
+    # sample is yielded as soon as it is decoded and stored. A failed request
+    # yields {"error": ...} in place of its sample.
+    key = _speech_cache_key(text, voice_description, count)
+    if use_cache:
+        cached = await _cached_samples(key)
+        if cached is not None:
+            for sample in cached:
+                yield sample
+            return
 
-    filename = f"{sample_id}.mp3"
-    filepath = upload_dir / filename
+    async def one() -> dict:
+        samples = await _save_generations(await _request_generations(text, voice_description, 1))
+        if not samples:
+            raise RuntimeError("Hume returned no audio")
+        return samples[0]
 
-    audio_bytes = base64.b64decode(audio_base64)
-    async with aiofiles.open(filepath, "wb") as f:
-        await f.write(audio_bytes)
+    tasks = [asyncio.create_task(one()) for _ in range(count)]
+    samples = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                sample = await next_done
+            except Exception as e:
+                yield {"error": str(e)}
+                continue
+            samples.append(sample)
+            yield sample
+    finally:
+        for task in tasks:
+            task.cancel()
 
-    return f"/uploads/{filename}"
+    if len(samples) == count:
+        await _speech_cache().set(key, {"samples": samples})
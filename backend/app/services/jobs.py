@@ -0,0 +1,409 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+import uuid
+from contextlib import closing, nullcontext
+from pathlib import Path
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import get_settings
+from app.services import replicate
+from app.services import openai_service
+from app.services import prediction_store
+from app.services import hume
+from app.services import elevenlabs
+from app.services import ffmpeg_pool
+from app.services import foregrounds
+from app.services.ffmpeg import encoder_profile, replace_greenscreen
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = {"succeeded", "failed"}
+
+_queue: asyncio.Queue | None = None
+_workers: list[asyncio.Task] = []
+_providers: dict[str, asyncio.Semaphore] = {}
+_subscribers: dict[str, set[asyncio.Queue]] = {}
+_db_lock = asyncio.Lock()
+
+
+def _connect() -> sqlite3.Connection:
+    settings = get_settings()
+    data_dir = Path(settings.data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+
+    conn = sqlite3.connect(data_dir / "jobs.sqlite")
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            request TEXT NOT NULL,
+            stages TEXT NOT NULL,
+            output_url TEXT,
+            error TEXT,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )"""
+    )
+    return conn
+
+
+def _row_to_job(row: sqlite3.Row) -> dict:
+    return {
+        "id": row["id"],
+        "status": row["status"],
+        "request": json.loads(row["request"]),
+        "stages": json.loads(row["stages"]),
+        "output_url": row["output_url"],
+        "error": row["error"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+
+
+def _save_sync(row: tuple):
+    with closing(_connect()) as conn, conn:
+        conn.execute("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+
+
+def _load_sync(job_id: str) -> dict | None:
+    with closing(_connect()) as conn:
+        row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+    return _row_to_job(row) if row else None
+
+
+def _load_unfinished_sync() -> list[str]:
+    with closing(_connect()) as conn:
+        rows = conn.execute(
+            "SELECT id FROM jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+        ).fetchall()
+    return [row["id"] for row in rows]
+
+
+async def _save(job: dict):
+    # Stages of one job run concurrently; serialise writes and snapshot the
+    # job on the event loop so the row always reflects the latest state
+    async with _db_lock:
+        job["updated_at"] = time.time()
+        snapshot = json.loads(json.dumps(job))
+        await run_in_threadpool(_save_sync, (
+            snapshot["id"],
+            snapshot["status"],
+            json.dumps(snapshot["request"]),
+            json.dumps(snapshot["stages"]),
+            snapshot["output_url"],
+            snapshot["error"],
+            snapshot["created_at"],
+            snapshot["updated_at"],
+        ))
+    for queue in _subscribers.get(job["id"], ()):
+        queue.put_nowait(snapshot)
+
+
+def _stage_graph(request: dict) -> dict[str, list[str]]:
+    graph = {"image": [], "voice": []}
+    if request.get("scene_description"):
+        graph["prompt"] = []
+        graph["video"] = ["image", "prompt"]
+    else:
+        graph["video"] = ["image"]
+    graph["lipsync"] = ["video", "voice"]
+    if request.get("background_url"):
+        graph["background"] = ["lipsync"]
+    return graph
+
+
+def _stage_provider(name: str, request: dict) -> str:
+    if name == "voice":
+        return "elevenlabs" if request.get("voice_id") else "hume"
+    return {
+        "image": "replicate",
+        "prompt": "openai",
+        "video": "replicate",
+        "lipsync": "replicate",
+        "background": "ffmpeg",
+    }[name]
+
+
+def _provider_slot(provider: str) -> asyncio.Semaphore:
+    return _providers.setdefault(provider, asyncio.Semaphore(1))
+
+
+async def _wait_for_prediction(prediction_id: str) -> dict:
+    return await prediction_store.wait(prediction_id, get_settings().job_poll_interval)
+
+
+async def _run_image(job: dict, stage: dict) -> dict:
+    request = job["request"]
+    image_url = await replicate.create_image(request["source_image_url"], request["style"])
+    return {"image_url": image_url}
+
+
+async def _run_prompt(job: dict, stage: dict) -> dict:
+    request = job["request"]
+    return await openai_service.generate_video_prompt_sections(
+        spoken_line=request["spoken_line"],
+        scene_description=request["scene_description"],
+        style=request["style"],
+    )
+
+
+async def _run_video(job: dict, stage: dict) -> dict:
+    request = job["request"]
+    stages = job["stages"]
+
+    # The prediction id is checkpointed so a restarted job resumes waiting
+    # on the same prediction instead of paying for a new one
+    prediction_id = stage["output"].get("prediction_id")
+    if not prediction_id:
+        sections = stages.get("prompt", {}).get("output", {})
+        async with _provider_slot("replicate"):
+            result = await replicate.create_video_prediction(
+                image_url=stages["image"]["output"]["image_url"],
+                spoken_line=request["spoken_line"],
+                duration=request["duration"],
+                animation_instructions=sections.get("animation_instructions"),
+                hand_arm_gestures=sections.get("hand_arm_gestures"),
+                style=request["style"],
+            )
+        prediction_id = result["id"]
+        prediction_store.track(result)
+        stage["output"]["prediction_id"] = prediction_id
+        await _save(job)
+
+    status = await _wait_for_prediction(prediction_id)
+    if status["status"] != "succeeded" or not status.get("output"):
+        raise RuntimeError(status.get("error") or f"Video prediction {status['status']}")
+    return {"prediction_id": prediction_id, "video_url": status["output"]}
+
+
+async def _run_voice(job: dict, stage: dict) -> dict:
+    request = job["request"]
+    if request.get("voice_id"):
+        audio_url = await elevenlabs.generate_speech(request["voice_id"], request["spoken_line"])
+        return {"audio_url": audio_url}
+
+    samples = await hume.generate_voice_samples(
+        text=request["spoken_line"],
+        voice_description=request["voice_description"],
+        count=1,
+    )
+    if not samples:
+        raise RuntimeError("Hume returned no voice samples")
+    return {"audio_url": samples[0]["audio_url"]}
+
+
+async def _run_lipsync(job: dict, stage: dict) -> dict:
+    stages = job["stages"]
+
+    # Checkpointed like the video prediction
+    prediction_id = stage["output"].get("prediction_id")
+    if not prediction_id:
+        async with _provider_slot("replicate"):
+            result = await replicate.create_lipsync_prediction(
+                video_url=stages["video"]["output"]["video_url"],
+                audio_path_or_url=stages["voice"]["output"]["audio_url"],
+            )
+        prediction_id = result["id"]
+        prediction_store.track(result)
+        stage["output"]["prediction_id"] = prediction_id
+        await _save(job)
+
+    status = await _wait_for_prediction(prediction_id)
+    if status["status"] != "succeeded" or not status.get("output"):
+        raise RuntimeError(status.get("error") or f"Lip sync prediction {status['status']}")
+    return {"prediction_id": prediction_id, "video_url": status["output"]}
+
+
+async def _run_background(job: dict, stage: dict) -> dict:
+    request = job["request"]
+    video_url = await replace_greenscreen(
+        video_url=job["stages"]["lipsync"]["output"]["video_url"],
+        background_url=request["background_url"],
+        scale=request["scale"],
+        profile=request.get("profile"),
+        key_color=request.get("key_color", foregrounds.DEFAULT_KEY_COLOR),
+        key_similarity=request.get("key_similarity", foregrounds.DEFAULT_SIMILARITY),
+        key_blend=request.get("key_blend", foregrounds.DEFAULT_BLEND),
+        priority=ffmpeg_pool.PRIORITY_LOW,
+    )
+    return {"video_url": video_url}
+
+
+# Stages that start a prediction and then wait minutes for it. They take the
+# provider slot themselves, only around creating the prediction.
+_PREDICTION_STAGES = {"video", "lipsync"}
+
+_STAGE_RUNNERS = {
+    "image": _run_image,
+    "prompt": _run_prompt,
+    "video": _run_video,
+    "voice": _run_voice,
+    "lipsync": _run_lipsync,
+    "background": _run_background,
+}
+
+
+async def _run_stage(job: dict, name: str):
+    stage = job["stages"][name]
+    provider = _stage_provider(name, job["request"])
+
+    slot = nullcontext() if name in _PREDICTION_STAGES else _provider_slot(provider)
+    async with slot:
+        stage["status"] = "running"
+        stage["error"] = None
+        stage["started_at"] = time.time()
+        stage["finished_at"] = None
+        await _save(job)
+        try:
+            output = await _STAGE_RUNNERS[name](job, stage)
+        except asyncio.CancelledError:
+            stage["status"] = "pending"
+            stage["started_at"] = None
+            raise
+        except Exception as e:
+            logger.error(f"Job {job['id']} stage {name} failed: {str(e)}")
+            stage["status"] = "failed"
+            stage["error"] = str(e)
+            stage["finished_at"] = time.time()
+            await _save(job)
+            raise
+
+    stage["status"] = "succeeded"
+    stage["output"] = output
+    stage["finished_at"] = time.time()
+    await _save(job)
+
+
+async def _run_stages(job: dict, graph: dict[str, list[str]]):
+    # Every stage whose dependencies have succeeded starts immediately, so
+    # independent branches (e.g. video and voice) overlap and only join at
+    # the stage that needs both
+    stages = job["stages"]
+    pending = {name for name in graph if stages[name]["status"] != "succeeded"}
+    running: dict[asyncio.Task, str] = {}
+    try:
+        while pending or running:
+            ready = [
+                name for name in pending
+                if all(stages[dep]["status"] == "succeeded" for dep in graph[name])
+            ]
+            for name in ready:
+                pending.discard(name)
+                running[asyncio.create_task(_run_stage(job, name))] = name
+            if not running:
+                raise ValueError(f"Unsatisfiable job stages: {sorted(pending)}")
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                del running[task]
+                task.result()
+    finally:
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+async def _run_job(job_id: str):
+    job = await run_in_threadpool(_load_sync, job_id)
+    if job is None or job["status"] in TERMINAL_STATUSES:
+        return
+
+    job["status"] = "running"
+    await _save(job)
+
+    graph = _stage_graph(job["request"])
+    try:
+        await _run_stages(job, graph)
+        last_stage = "background" if "background" in graph else "lipsync"
+        job["output_url"] = job["stages"][last_stage]["output"]["video_url"]
+        job["status"] = "succeeded"
+    except Exception as e:
+        job["status"] = "failed"
+        job["error"] = str(e)
+    await _save(job)
+
+
+async def _worker():
+    while True:
+        job_id = await _queue.get()
+        try:
+            await _run_job(job_id)
+        except Exception:
+            logger.exception(f"Job {job_id} crashed")
+        finally:
+            _queue.task_done()
+
+
+async def create_job(request: dict) -> dict:
+    if request.get("background_url"):
+        # Fail now rather than after the expensive stages have run
+        encoder_profile(request.get("profile"))
+
+    now = time.time()
+    job = {
+        "id": str(uuid.uuid4()),
+        "status": "queued",
+        "request": request,
+        "stages": {
+            name: {
+                "status": "pending",
+                "output": {},
+                "error": None,
+                "started_at": None,
+                "finished_at": None,
+            }
+            for name in _stage_graph(request)
+        },
+        "output_url": None,
+        "error": None,
+        "created_at": now,
+        "updated_at": now,
+    }
+    await _save(job)
+    _queue.put_nowait(job["id"])
+    return job
+
+
+async def get_job(job_id: str) -> dict | None:
+    return await run_in_threadpool(_load_sync, job_id)
+
+
+def subscribe(job_id: str) -> asyncio.Queue:
+    queue = asyncio.Queue()
+    _subscribers.setdefault(job_id, set()).add(queue)
+    return queue
+
+
+def unsubscribe(job_id: str, queue: asyncio.Queue):
+    subscribers = _subscribers.get(job_id)
+    if subscribers is not None:
+        subscribers.discard(queue)
+        if not subscribers:
+            del _subscribers[job_id]
+
+
+async def start():
+    global _queue
+    settings = get_settings()
+    _queue = asyncio.Queue()
+    _providers.clear()
+    for provider, limit in settings.job_provider_concurrency.items():
+        _providers[provider] = asyncio.Semaphore(limit)
+    _workers.extend(asyncio.create_task(_worker()) for _ in range(settings.job_workers))
+
+    # Jobs that were queued or mid-flight when the process stopped are resumed;
+    # stages that already succeeded are skipped
+    for job_id in await run_in_threadpool(_load_unfinished_sync):
+        logger.info(f"Resuming job {job_id}")
+        _queue.put_nowait(job_id)
+
+
+async def stop():
+    for worker in _workers:
+        worker.cancel()
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
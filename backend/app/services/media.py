@@ -0,0 +1,104 @@
+import asyncio
+import json
+import logging
+from pathlib import Path
+
+from app.config import get_settings
+from app.services.cache import get_cache, make_key
+
+logger = logging.getLogger(__name__)
+
+# ffprobe results keyed by (path, mtime, size): one probe per file version,
+# kept in memory with the SQLite cache behind it
+
+
+def _cache():
+    settings = get_settings()
+    return get_cache(
+        "media",
+        max_entries=settings.media_cache_max_entries,
+        memory_entries=settings.media_cache_memory_entries,
+    )
+
+
+def _float(value) -> float | None:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _frame_rate(rate: str | None) -> float | None:
+    try:
+        num, den = rate.split("/")
+        return int(num) / int(den) if int(den) else None
+    except (AttributeError, ValueError):
+        return None
+
+
+def _summarize(probe: dict) -> dict:
+    fmt = probe.get("format", {})
+    streams = probe.get("streams", [])
+    video = next((s for s in streams if s.get("codec_type") == "video"), None)
+    audio = next((s for s in streams if s.get("codec_type") == "audio"), None)
+    return {
+        "format": fmt.get("format_name"),
+        "duration": _float(fmt.get("duration")),
+        "bit_rate": _float(fmt.get("bit_rate")),
+        "video": video and {
+            "codec": video.get("codec_name"),
+            "width": video.get("width"),
+            "height": video.get("height"),
+            "pix_fmt": video.get("pix_fmt"),
+            "r_frame_rate": video.get("r_frame_rate"),
+            "fps": _frame_rate(video.get("r_frame_rate")),
+            "duration": _float(video.get("duration")),
+        },
+        "audio": audio and {
+            "codec": audio.get("codec_name"),
+            "sample_rate": int(audio["sample_rate"]) if audio.get("sample_rate") else None,
+            "channels": audio.get("channels"),
+            "duration": _float(audio.get("duration")),
+        },
+    }
+
+
+async def _probe(path: Path) -> dict:
+    cmd = [
+        "ffprobe", "-v", "error",
+        "-show_streams", "-show_format",
+        "-of", "json",
+        str(path),
+    ]
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    stdout, stderr = await process.communicate()
+
+    if process.returncode != 0:
+        raise RuntimeError(f"FFprobe failed: {stderr.decode()}")
+
+    return _summarize(json.loads(stdout))
+
+
+async def probe(path: Path) -> dict:
+    # Duration, dimensions, codecs and frame rate of a media file. Scratch
+    # files (all created with a leading-dot temp prefix) are about to be
+    # renamed or deleted, so caching them would only push out real entries.
+    if path.name.startswith("."):
+        return await _probe(path)
+
+    stat = path.stat()
+    key = make_key(str(path.resolve()), stat.st_mtime_ns, stat.st_size)
+    cached = await _cache().get(key)
+    if cached is not None:
+        return cached
+
+    async def run():
+        info = await _probe(path)
+        await _cache().set(key, info)
+        return info
+
+    return await _cache().single_flight(key, run)
@@ -1,19 +1,23 @@
 import json
 import logging
+from functools import lru_cache
 from openai import OpenAI
 from fastapi.concurrency import run_in_threadpool
+from app import clients
 from app.config import get_settings
+from app.tracing import trace
+from app.services.cache import get_cache, make_key
 
 logger = logging.getLogger(__name__)
 
+PROMPT_MODEL = "gpt-5.2"
+
 
 def _get_client() -> OpenAI:
-    settings = get_settings()
-    if not settings.openai_api_key:
-        raise ValueError("OPENAI_API_KEY not set")
-    return OpenAI(api_key=settings.openai_api_key)
+    return clients.openai_client()
 
 
+@lru_cache
 def _get_meta_prompt(style: str = "Playstation 2") -> str:
     style_descriptions = {
         "Playstation 2": "PS2-era GTA San Andreas style character",
@@ -59,15 +63,6 @@ Example output:
 Remember: Be conservative with animation instructions - only deviate from defaults if explicitly requested."""
 
 
-def _debug_log(hypothesis_id: str, message: str, data: dict):
-    # #region agent log
-    import time
-    log_path = "/Users/kai.perich/Projects/Private/talkaz/.cursor/debug.log"
-    entry = json.dumps({"hypothesisId": hypothesis_id, "location": "openai_service.py", "message": message, "data": data, "timestamp": int(time.time() * 1000), "sessionId": "debug-session"})
-    with open(log_path, "a") as f:
-        f.write(entry + "\n")
-    # #endregion
-
 def generate_video_prompt_sections_sync(
     spoken_line: str,
     scene_description: str,
@@ -84,12 +79,10 @@ Spoken line: "{spoken_line}"
 
 Generate the "Animation instructions" and "Hand and arm gestures" sections for the video prompt. Return ONLY valid JSON."""
 
-    # #region agent log
-    _debug_log("H5", "API call starting", {"model": "gpt-5.2", "prompt_length": len(full_prompt)})
-    # #endregion
+    trace("openai_service.generate_video_prompt_sections_sync", "API call starting", model=PROMPT_MODEL, prompt_length=len(full_prompt))
 
     response = client.responses.create(
-        model="gpt-5.2",
+        model=PROMPT_MODEL,
         input=full_prompt,
         reasoning={
             "effort": "none"
@@ -99,10 +92,7 @@ Generate the "Animation instructions" and "Hand and arm gestures" sections for t
         }
     )
     
-    # #region agent log
-    _debug_log("H1", "Response received", {"type": str(type(response)), "attributes": [a for a in dir(response) if not a.startswith("_")]})
-    _debug_log("H1", "Full response repr", {"repr": repr(response)[:1000]})
-    # #endregion
+    trace("openai_service.generate_video_prompt_sections_sync", "Response received", type=type(response).__name__)
     
     # Extract content from response - GPT-5.2 uses output_text convenience property
     logger.debug(f"GPT-5.2 response type: {type(response)}")
@@ -111,29 +101,18 @@ Generate the "Animation instructions" and "Hand and arm gestures" sections for t
     
     # GPT-5.2 responses.create() API: Use output_text convenience property
     if hasattr(response, 'output_text') and response.output_text:
-        # #region agent log
-        _debug_log("FIX", "Using output_text property", {"output_text": str(response.output_text)[:500]})
-        # #endregion
+        trace("openai_service.generate_video_prompt_sections_sync", "Using output_text property")
         content = response.output_text
     # Fallback: Extract from nested structure
     elif hasattr(response, 'output') and response.output:
-        # #region agent log
-        _debug_log("FIX", "Extracting from nested output structure", {"output_length": len(response.output)})
-        # #endregion
+        trace("openai_service.generate_video_prompt_sections_sync", "Extracting from nested output structure", output_length=len(response.output))
         try:
             content = response.output[0].content[0].text
-            # #region agent log
-            _debug_log("FIX", "Extracted text from output[0].content[0].text", {"text": str(content)[:500]})
-            # #endregion
         except (IndexError, AttributeError) as e:
-            # #region agent log
-            _debug_log("FIX", "Failed to extract from nested structure", {"error": str(e)})
-            # #endregion
+            trace("openai_service.generate_video_prompt_sections_sync", "Failed to extract from nested structure", error=str(e))
             pass
     
-    # #region agent log
-    _debug_log("H2", "Extracted content check", {"content_is_none": content is None, "content_type": str(type(content)) if content else "None", "content_preview": str(content)[:500] if content else "None"})
-    # #endregion
+    trace("openai_service.generate_video_prompt_sections_sync", "Extracted content", content_is_none=content is None)
     
     if not content:
         logger.error(f"Empty response from GPT-5.2. Response object: {response}")
@@ -145,9 +124,7 @@ Generate the "Animation instructions" and "Hand and arm gestures" sections for t
     # The response might be wrapped in markdown code blocks
     content_str = str(content).strip()
     
-    # #region agent log
-    _debug_log("H3", "Content string before processing", {"content_str": content_str[:500], "starts_with_backtick": content_str.startswith("```"), "starts_with_brace": content_str.startswith("{")})
-    # #endregion
+    trace("openai_service.generate_video_prompt_sections_sync", "Content string before processing", starts_with_backtick=content_str.startswith("```"))
     
     if content_str.startswith("```"):
         # Extract JSON from code block
@@ -165,9 +142,7 @@ Generate the "Animation instructions" and "Hand and arm gestures" sections for t
                 json_lines.append(line)
         content_str = "\n".join(json_lines)
     
-    # #region agent log
-    _debug_log("H4", "Content string after processing", {"content_str": content_str[:500], "length": len(content_str)})
-    # #endregion
+    trace("openai_service.generate_video_prompt_sections_sync", "Content string after processing", length=len(content_str))
     
     result = json.loads(content_str)
     
@@ -180,14 +155,43 @@ Generate the "Animation instructions" and "Hand and arm gestures" sections for t
     }
 
 
+def _prompt_cache():
+    settings = get_settings()
+    return get_cache(
+        "prompt_sections",
+        max_entries=settings.prompt_cache_max_entries,
+        memory_entries=settings.prompt_cache_memory_entries,
+    )
+
+
+def _prompt_cache_key(spoken_line: str, scene_description: str, style: str) -> str:
+    settings = get_settings()
+    scene = scene_description.strip()
+    line = spoken_line.strip()
+    if settings.prompt_cache_near_duplicates:
+        # Case is only folded for the scene: ALL CAPS in the spoken line marks
+        # emphasis and changes the generated gestures
+        scene = " ".join(scene.split()).casefold()
+        line = " ".join(line.split())
+    return make_key(style, scene, line, PROMPT_MODEL)
+
+
 async def generate_video_prompt_sections(
     spoken_line: str,
     scene_description: str,
     style: str = "Playstation 2"
 ) -> dict[str, str]:
-    return await run_in_threadpool(
+    cache_key = _prompt_cache_key(spoken_line, scene_description, style)
+    cached = await _prompt_cache().get(cache_key)
+    if cached is not None:
+        logger.info("Prompt sections cache hit")
+        return cached
+
+    sections = await run_in_threadpool(
         generate_video_prompt_sections_sync,
         spoken_line,
         scene_description,
         style
     )
+    await _prompt_cache().set(cache_key, sections)
+    return sections
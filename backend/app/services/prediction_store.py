@@ -0,0 +1,141 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+
+from app.config import get_settings
+from app.services import replicate
+
+logger = logging.getLogger(__name__)
+
+TERMINAL_STATUSES = {"succeeded", "failed", "canceled"}
+
+# Terminal results never change, so they are kept until LRU eviction.
+# In-flight results are only trusted for prediction_status_ttl seconds, or
+# prediction_webhook_fallback_interval when a webhook will push updates.
+_terminal: OrderedDict[str, dict] = OrderedDict()
+_in_flight: dict[str, dict] = {}
+_fetched_at: dict[str, float] = {}
+_last_requested: dict[str, float] = {}
+_fetches: dict[str, asyncio.Future] = {}
+_webhooked: set[str] = set()
+
+
+def _forget(prediction_id: str):
+    _in_flight.pop(prediction_id, None)
+    _fetched_at.pop(prediction_id, None)
+    _last_requested.pop(prediction_id, None)
+    _webhooked.discard(prediction_id)
+
+
+def _max_age(prediction_id: str) -> float:
+    settings = get_settings()
+    if prediction_id in _webhooked:
+        return settings.prediction_webhook_fallback_interval
+    return settings.prediction_status_ttl
+
+
+def put(prediction_id: str, status: dict):
+    settings = get_settings()
+    if status["status"] in TERMINAL_STATUSES:
+        _forget(prediction_id)
+        _terminal[prediction_id] = status
+        _terminal.move_to_end(prediction_id)
+        while len(_terminal) > settings.prediction_cache_size:
+            _terminal.popitem(last=False)
+    elif prediction_id not in _terminal:
+        _in_flight[prediction_id] = status
+        _fetched_at[prediction_id] = time.monotonic()
+        _last_requested.setdefault(prediction_id, time.monotonic())
+
+
+def is_tracked(prediction_id: str) -> bool:
+    return prediction_id in _terminal or prediction_id in _in_flight
+
+
+def get(prediction_id: str) -> dict | None:
+    if prediction_id in _terminal:
+        _terminal.move_to_end(prediction_id)
+        return _terminal[prediction_id]
+
+    status = _in_flight.get(prediction_id)
+    if status is None:
+        return None
+    _last_requested[prediction_id] = time.monotonic()
+    age = time.monotonic() - _fetched_at[prediction_id]
+    if age > _max_age(prediction_id):
+        return None
+    return status
+
+
+async def _fetch(prediction_id: str) -> dict:
+    # Concurrent misses for the same id share one upstream request
+    future = _fetches.get(prediction_id)
+    if future is None:
+        future = asyncio.ensure_future(replicate.get_prediction_status(prediction_id))
+        _fetches[prediction_id] = future
+        future.add_done_callback(lambda _: _fetches.pop(prediction_id, None))
+    status = await asyncio.shield(future)
+    put(prediction_id, status)
+    return status
+
+
+async def get_status(prediction_id: str) -> dict:
+    status = get(prediction_id)
+    if status is not None:
+        return status
+    return await _fetch(prediction_id)
+
+
+def track(prediction: dict):
+    # Registers a just-created prediction so webhooks and the poller update it
+    if prediction.get("webhook"):
+        _webhooked.add(prediction["id"])
+    put(prediction["id"], {
+        "id": prediction["id"],
+        "status": prediction["status"],
+        "output": None,
+        "error": None,
+    })
+
+
+async def wait(prediction_id: str, poll_interval: float) -> dict:
+    while True:
+        status = await get_status(prediction_id)
+        if status["status"] in TERMINAL_STATUSES:
+            return status
+        await asyncio.sleep(poll_interval)
+
+
+async def _refresh_in_flight():
+    settings = get_settings()
+    now = time.monotonic()
+    for prediction_id, requested_at in list(_last_requested.items()):
+        if now - requested_at > settings.prediction_track_timeout:
+            logger.info(f"Dropping stale in-flight prediction {prediction_id}")
+            _forget(prediction_id)
+
+    # Predictions with a webhook are only polled as a fallback, much less often
+    stale = [
+        prediction_id
+        for prediction_id, fetched_at in _fetched_at.items()
+        if now - fetched_at >= (
+            settings.prediction_webhook_fallback_interval if prediction_id in _webhooked
+            else settings.prediction_poll_interval
+        )
+    ]
+    results = await asyncio.gather(*(_fetch(p) for p in stale), return_exceptions=True)
+    for prediction_id, result in zip(stale, results):
+        if isinstance(result, Exception):
+            logger.warning(f"Polling prediction {prediction_id} failed: {result}")
+
+
+async def run_poller():
+    # Fallback for predictions whose webhook never arrives (or no webhook URL configured)
+    settings = get_settings()
+    while True:
+        await asyncio.sleep(settings.prediction_poll_interval)
+        try:
+            await _refresh_in_flight()
+        except Exception as e:
+            logger.error(f"Prediction poller iteration failed: {str(e)}")
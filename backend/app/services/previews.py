@@ -0,0 +1,36 @@
+import logging
+from pathlib import Path
+
+from app.config import get_settings
+from app.services.cache import FileCache, get_file_cache
+
+logger = logging.getLogger(__name__)
+
+# Preview stills and clips, served from upload_dir/previews but outside the
+# permanent store: keyed by everything that affects the render and bounded
+# by disk use, so slider tweaks don't grow disk and repeats are free.
+
+
+def _cache() -> FileCache:
+    settings = get_settings()
+    return get_file_cache(
+        "previews",
+        Path(settings.upload_dir) / "previews",
+        max_entries=settings.preview_cache_max_entries,
+        max_bytes=settings.preview_cache_max_bytes,
+    )
+
+
+async def lookup(cache_key: str) -> str | None:
+    cached = await _cache().lookup(cache_key)
+    return cached["url"] if cached is not None else None
+
+
+def writing(ext: str):
+    return _cache().writing(ext)
+
+
+async def store(cache_key: str, source: Path, ext: str) -> str:
+    name = f"{cache_key}{ext}"
+    entry = await _cache().store(cache_key, source, name, url=f"/uploads/previews/{name}")
+    return entry["url"]
@@ -1,18 +1,24 @@
+import hashlib
 import replicate
-import os
 import logging
 from pathlib import Path
-from fastapi.concurrency import run_in_threadpool
+from urllib.parse import urlparse
+from replicate.webhook import WebhookSigningSecret, WebhookValidationError
+from app import clients
 from app.config import get_settings
+from app.tracing import trace
+from app.services.cache import get_cache, make_key
+from app.services.storage import get_storage
+from app.services.url_resolver import download_file, local_upload_path
 
 logger = logging.getLogger(__name__)
 
 
-def _ensure_replicate_token():
-    settings = get_settings()
-    token = settings.replicate_api_token
-    if token and not os.environ.get("REPLICATE_API_TOKEN"):
-        os.environ["REPLICATE_API_TOKEN"] = token
+def _get_client() -> replicate.Client:
+    return clients.replicate_client()
+
+
+IMAGE_MODEL = "google/nano-banana-pro"
 
 STYLE_PROMPTS = {
     "Playstation 2": """Create an authentic early 2000s PlayStation 2 (PS2) video game character
@@ -273,25 +279,7 @@ random text, floating text,
 any written content of any kind"""
 
 
-def create_image_sync(source_image_url: str, style_prompt: str) -> str:
-    _ensure_replicate_token()
-    prompt = STYLE_PROMPTS.get(style_prompt, style_prompt)
-    
-    settings = get_settings()
-    relative_path = source_image_url.split("/uploads/")[-1]
-    file_path = Path(settings.upload_dir) / relative_path
-    
-    with open(file_path, "rb") as f:
-        output = replicate.run(
-            "google/nano-banana-pro",
-            input={
-                "prompt": prompt,
-                "image_input": [f],
-                "aspect_ratio": "4:3",
-                "output_format": "png",
-            }
-        )
-    
+def _output_to_url(output) -> str:
     if hasattr(output, 'url'):
         return output.url
     elif isinstance(output, str):
@@ -303,27 +291,95 @@ def create_image_sync(source_image_url: str, style_prompt: str) -> str:
         return str(output)
 
 
-def create_video_sync(
-    image_url: str,
-    spoken_line: str,
-    duration: float = 5.0,
-    animation_instructions: str | None = None,
-    hand_arm_gestures: str | None = None,
-    style: str = "Playstation 2"
-) -> str:
-    _ensure_replicate_token()
-    video_prompt = get_video_prompt(spoken_line, animation_instructions, hand_arm_gestures, style)
-    output = replicate.run(
-        "kwaivgi/kling-v2.5-turbo-pro",
-        input={
-            "start_image": image_url,
-            "prompt": video_prompt,
-            "negative_prompt": VIDEO_NEGATIVE_PROMPT,
-            "duration": int(duration),
-            "aspect_ratio": "9:16",
-        }
+def _upload_cache():
+    # Local file content hash -> Replicate file URL, kept well inside the
+    # lifetime of uploaded files so a cached URL is still valid when used
+    settings = get_settings()
+    return get_cache(
+        "replicate_files",
+        max_entries=settings.replicate_file_cache_max_entries,
+        max_age=settings.replicate_file_max_age,
     )
-    return output.url if hasattr(output, 'url') else str(output)
+
+
+async def _input_url(url: str) -> str:
+    # Remote URLs are passed through. Our own uploads are served to Replicate
+    # from public_base_url when there is one, otherwise uploaded once through
+    # the files API.
+    file_path = local_upload_path(url)
+    if file_path is None:
+        return url
+
+    settings = get_settings()
+    if settings.public_base_url:
+        return f"{settings.public_base_url.rstrip('/')}/uploads/{file_path.name}"
+
+    key = make_key(await get_storage().content_hash(file_path))
+    cached = await _upload_cache().get(key)
+    if cached is not None:
+        return cached["url"]
+
+    logger.info(f"Uploading {file_path.name} to Replicate")
+    uploaded = await _get_client().files.async_create(file_path)
+    await _upload_cache().set(key, {"url": uploaded.urls["get"]})
+    return uploaded.urls["get"]
+
+
+def _image_cache():
+    # Outputs are copied into storage, so entries stay valid however old they are
+    return get_cache("image", max_entries=get_settings().image_cache_max_entries)
+
+
+async def _store_output(output_url: str) -> str:
+    # Replicate only serves outputs for about an hour; keep our own copy
+    suffix = Path(urlparse(output_url).path).suffix or ".png"
+    with get_storage().scratch(suffix) as download_path:
+        sha256 = await download_file(output_url, download_path)
+        blob = await get_storage().put_file(download_path, suffix, sha256)
+    return blob["url"]
+
+
+async def create_image(source_image_url: str, style_prompt: str, use_cache: bool = True) -> str:
+    prompt = STYLE_PROMPTS.get(style_prompt, style_prompt)
+    
+    # Our own uploads are sent as files, anything else is handed to
+    # Replicate as a URL without passing through this server
+    file_path = local_upload_path(source_image_url)
+
+    cache_key = None
+    if use_cache:
+        if file_path is not None:
+            source_hash = await get_storage().content_hash(file_path)
+        else:
+            source_hash = hashlib.sha256(source_image_url.encode()).hexdigest()
+        prompt_hash = hashlib.sha256(prompt.encode()).hexdigest()
+        cache_key = make_key(source_hash, prompt_hash, IMAGE_MODEL)
+        cached = await _image_cache().get(cache_key)
+        if cached is not None and local_upload_path(cached["output_url"]) is not None:
+            logger.info(f"Image cache hit for {source_image_url}")
+            return cached["output_url"]
+
+    image_input = {
+        "prompt": prompt,
+        "aspect_ratio": "4:3",
+        "output_format": "png",
+    }
+    if file_path is None:
+        output = await _get_client().async_run(
+            IMAGE_MODEL,
+            input={**image_input, "image_input": [source_image_url]},
+        )
+    else:
+        with open(file_path, "rb") as f:
+            output = await _get_client().async_run(
+                IMAGE_MODEL,
+                input={**image_input, "image_input": [f]},
+            )
+    
+    output_url = await _store_output(_output_to_url(output))
+    if cache_key is not None:
+        await _image_cache().set(cache_key, {"output_url": output_url})
+    return output_url
 
 
 async def create_video_prediction(
@@ -334,84 +390,94 @@ async def create_video_prediction(
     hand_arm_gestures: str | None = None,
     style: str = "Playstation 2"
 ) -> dict:
-    _ensure_replicate_token()
     video_prompt = get_video_prompt(spoken_line, animation_instructions, hand_arm_gestures, style)
-    prediction = replicate.predictions.create(
+    webhook = _webhook_params()
+    prediction = await _get_client().predictions.async_create(
         model="kwaivgi/kling-v2.5-turbo-pro",
         input={
-            "start_image": image_url,
+            "start_image": await _input_url(image_url),
             "prompt": video_prompt,
             "negative_prompt": VIDEO_NEGATIVE_PROMPT,
             "duration": int(duration),
             "aspect_ratio": "9:16",
-        }
+        },
+        **webhook,
     )
     return {
         "id": prediction.id,
         "status": prediction.status,
+        "webhook": bool(webhook),
     }
 
 
-async def get_prediction_status(prediction_id: str) -> dict:
-    _ensure_replicate_token()
-    prediction = replicate.predictions.get(prediction_id)
+def status_from_prediction(data: dict) -> dict:
     output_url = None
-    if prediction.status == "succeeded" and prediction.output:
-        output = prediction.output
-        if isinstance(output, list) and len(output) > 0:
-            output_url = output[0].url if hasattr(output[0], 'url') else str(output[0])
-        elif hasattr(output, 'url'):
-            output_url = output.url
-        else:
-            output_url = str(output)
+    if data.get("status") == "succeeded" and data.get("output"):
+        output_url = _output_to_url(data["output"])
     
     return {
-        "status": prediction.status,
+        "id": data.get("id"),
+        "status": data.get("status"),
         "output": output_url,
+        "error": data.get("error"),
+    }
+
+
+async def get_prediction_status(prediction_id: str) -> dict:
+    prediction = await _get_client().predictions.async_get(prediction_id)
+    return status_from_prediction({
+        "id": prediction.id,
+        "status": prediction.status,
+        "output": prediction.output,
         "error": prediction.error,
+    })
+
+
+def _webhook_params() -> dict:
+    # Webhooks are only requested when we can also verify them; otherwise the
+    # prediction store's poller picks up the result
+    settings = get_settings()
+    if not settings.public_base_url or not settings.replicate_webhook_secret:
+        return {}
+    return {
+        "webhook": f"{settings.public_base_url.rstrip('/')}/api/v1/webhooks/replicate",
+        "webhook_events_filter": ["start", "completed"],
     }
 
 
-def apply_lipsync_sync(video_url: str, audio_file) -> str:
-    _ensure_replicate_token()
-    # #region agent log
-    import json, time
-    log_path = "/Users/kai.perich/Projects/Private/talkaz/.cursor/debug.log"
-    entry = json.dumps({"hypothesisId": "LIPSYNC", "location": "replicate.py:apply_lipsync_sync", "message": "Starting lip sync", "data": {"video_url": video_url, "audio_type": str(type(audio_file))}, "timestamp": int(time.time() * 1000), "sessionId": "debug-session"})
-    with open(log_path, "a") as f:
-        f.write(entry + "\n")
-    # #endregion
-    output = replicate.run(
-        "kwaivgi/kling-lip-sync",
-        input={
-            "video_url": video_url,
-            "audio_file": audio_file,
-        }
-    )
-    # #region agent log
-    entry = json.dumps({"hypothesisId": "LIPSYNC", "location": "replicate.py:apply_lipsync_sync", "message": "Lip sync completed", "data": {"output_type": str(type(output)), "has_url": hasattr(output, 'url')}, "timestamp": int(time.time() * 1000), "sessionId": "debug-session"})
-    with open(log_path, "a") as f:
-        f.write(entry + "\n")
-    # #endregion
-    if hasattr(output, 'url'):
-        return output.url
-    elif isinstance(output, str):
-        return output
-    elif isinstance(output, list) and len(output) > 0:
-        item = output[0]
-        return item.url if hasattr(item, 'url') else str(item)
-    else:
-        return str(output)
+def webhooks_enabled() -> bool:
+    return bool(get_settings().replicate_webhook_secret)
 
 
-async def apply_lipsync(video_url: str, audio_path_or_url: str) -> str:
+def validate_webhook(headers: dict[str, str], body: str):
     settings = get_settings()
-    
-    if "/uploads/" in audio_path_or_url:
-        relative_path = audio_path_or_url.split("/uploads/")[-1]
-        file_path = Path(settings.upload_dir) / relative_path
-        logger.info(f"Loading local audio file: {file_path}")
-        with open(file_path, "rb") as f:
-            return await run_in_threadpool(apply_lipsync_sync, video_url, f)
-    else:
-        return await run_in_threadpool(apply_lipsync_sync, video_url, audio_path_or_url)
+    if not settings.replicate_webhook_secret:
+        raise WebhookValidationError("No webhook secret configured")
+    replicate.webhooks.validate(
+        headers=headers,
+        body=body,
+        secret=WebhookSigningSecret(key=settings.replicate_webhook_secret),
+        tolerance=300,
+    )
+
+
+LIPSYNC_MODEL = "kwaivgi/kling-lip-sync"
+
+
+async def create_lipsync_prediction(video_url: str, audio_path_or_url: str) -> dict:
+    audio_url = await _input_url(audio_path_or_url)
+    webhook = _webhook_params()
+    trace("replicate.create_lipsync_prediction", "Starting lip sync", video_url=video_url, audio_url=audio_url)
+    prediction = await _get_client().predictions.async_create(
+        model=LIPSYNC_MODEL,
+        input={
+            "video_url": video_url,
+            "audio_file": audio_url,
+        },
+        **webhook,
+    )
+    return {
+        "id": prediction.id,
+        "status": prediction.status,
+        "webhook": bool(webhook),
+    }
@@ -1,23 +1,184 @@
-import uuid
+import hashlib
+import os
+import sqlite3
+import tempfile
+import time
 import aiofiles
+import aiofiles.os
+from contextlib import closing, contextmanager
+from functools import lru_cache
 from pathlib import Path
+from typing import Iterator
 from fastapi import UploadFile
+from fastapi.concurrency import run_in_threadpool
 
 from app.config import get_settings
 
 
-async def save_upload(file: UploadFile) -> tuple[str, str]:
+class UploadTooLargeError(ValueError):
+    pass
+
+
+async def write_upload(file: UploadFile, filepath: Path, max_bytes: int | None = None) -> tuple[str, int]:
+    # Streams the upload in fixed-size chunks to a temp file next to the
+    # target, hashing as it goes, then renames it into place. Memory use
+    # stays at one chunk regardless of the upload size.
     settings = get_settings()
-    upload_dir = Path(settings.upload_dir)
-    upload_dir.mkdir(exist_ok=True)
+    if max_bytes is None:
+        max_bytes = settings.max_upload_bytes
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLargeError(f"Upload exceeds {max_bytes} bytes")
+
+    fd, tmp_name = tempfile.mkstemp(dir=filepath.parent, prefix=".upload-", suffix=".part")
+    os.close(fd)
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_name, "wb") as f:
+            while chunk := await file.read(settings.upload_chunk_size):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"Upload exceeds {max_bytes} bytes")
+                digest.update(chunk)
+                await f.write(chunk)
+        await aiofiles.os.replace(tmp_name, filepath)
+    except BaseException:
+        Path(tmp_name).unlink(missing_ok=True)
+        raise
+
+    return digest.hexdigest(), size
+
+
+def hash_file(path: Path, chunk_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Content-addressed blob store behind the /uploads mount. Blobs are named by
+# their SHA-256, so identical content is stored once and a duplicate costs a
+# single index lookup. The index lives outside the served directory.
+class Storage:
+    def __init__(self, root: Path, index_path: Path):
+        self.root = root
+        self.index_path = index_path
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.index_path.parent.mkdir(parents=True, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                """CREATE TABLE IF NOT EXISTS blobs (
+                    sha256 TEXT PRIMARY KEY,
+                    name TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL
+                )"""
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.index_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _blob(self, name: str, sha256: str, size: int) -> dict:
+        return {
+            "sha256": sha256,
+            "name": name,
+            "size": size,
+            "path": self.root / name,
+            "url": f"/uploads/{name}",
+        }
+
+    def lookup_sync(self, sha256: str) -> dict | None:
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM blobs WHERE sha256 = ?", (sha256,)).fetchone()
+        if row is None or not (self.root / row["name"]).exists():
+            return None
+        return self._blob(row["name"], row["sha256"], row["size"])
+
+    def _commit_sync(self, source: Path, sha256: str, ext: str) -> dict:
+        existing = self.lookup_sync(sha256)
+        if existing is not None:
+            source.unlink(missing_ok=True)
+            return existing
 
-    ext = Path(file.filename).suffix if file.filename else ".bin"
-    file_id = str(uuid.uuid4())
-    filename = f"{file_id}{ext}"
-    filepath = upload_dir / filename
+        name = f"{sha256}{ext}"
+        size = source.stat().st_size
+        os.replace(source, self.root / name)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO blobs VALUES (?, ?, ?, ?)",
+                (sha256, name, size, time.time()),
+            )
+        return self._blob(name, sha256, size)
+
+    def _put_bytes_sync(self, data: bytes, ext: str) -> dict:
+        sha256 = hashlib.sha256(data).hexdigest()
+        existing = self.lookup_sync(sha256)
+        if existing is not None:
+            return existing
+
+        fd, tmp_name = tempfile.mkstemp(dir=self.root, prefix=".blob-", suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return self._commit_sync(Path(tmp_name), sha256, ext)
+
+    async def lookup(self, sha256: str) -> dict | None:
+        return await run_in_threadpool(self.lookup_sync, sha256)
+
+    async def put_bytes(self, data: bytes, ext: str) -> dict:
+        return await run_in_threadpool(self._put_bytes_sync, data, ext)
+
+    async def put_file(self, source: Path, ext: str, sha256: str | None = None) -> dict:
+        # Moves source into the store (or drops it if the content is already there)
+        if sha256 is None:
+            sha256 = await run_in_threadpool(hash_file, source)
+        return await run_in_threadpool(self._commit_sync, source, sha256, ext)
+
+    async def put_upload(self, file: UploadFile, max_bytes: int | None = None) -> dict:
+        ext = Path(file.filename).suffix if file.filename else ".bin"
+        fd, tmp_name = tempfile.mkstemp(dir=self.root, prefix=".upload-", suffix=".part")
+        os.close(fd)
+        tmp_path = Path(tmp_name)
+        try:
+            sha256, _ = await write_upload(file, tmp_path, max_bytes)
+            return await self.put_file(tmp_path, ext, sha256)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+    async def content_hash(self, path: Path) -> str:
+        # Files already in the store are named by their hash; anything else is hashed
+        if path.parent.resolve() == self.root.resolve():
+            blob = await self.lookup(path.stem)
+            if blob is not None and blob["name"] == path.name:
+                return blob["sha256"]
+        return await run_in_threadpool(hash_file, path)
+
+    def temp_path(self, suffix: str) -> Path:
+        # Scratch location on the same filesystem, so put_file is a rename
+        fd, tmp_name = tempfile.mkstemp(dir=self.root, prefix=".work-", suffix=suffix)
+        os.close(fd)
+        return Path(tmp_name)
+
+    @contextmanager
+    def scratch(self, suffix: str) -> Iterator[Path]:
+        # temp_path that is always removed on exit; once put_file has moved
+        # it into the store there is nothing left to remove
+        path = self.temp_path(suffix)
+        try:
+            yield path
+        finally:
+            path.unlink(missing_ok=True)
+
+
+@lru_cache
+def get_storage() -> Storage:
+    settings = get_settings()
+    return Storage(Path(settings.upload_dir), Path(settings.data_dir) / "storage.sqlite")
 
-    async with aiofiles.open(filepath, "wb") as f:
-        content = await file.read()
-        await f.write(content)
 
-    return file_id, f"/uploads/{filename}"
+async def save_upload(file: UploadFile, max_bytes: int | None = None) -> tuple[str, str]:
+    blob = await get_storage().put_upload(file, max_bytes)
+    return blob["sha256"], blob["url"]
@@ -0,0 +1,157 @@
+import asyncio
+import hashlib
+import logging
+import aiofiles
+import aiofiles.os
+import httpx
+from contextlib import AsyncExitStack, asynccontextmanager
+from pathlib import Path
+from typing import Callable
+from urllib.parse import unquote, urlparse
+
+from app import clients
+from app.config import get_settings
+from app.services.cache import FileCache, enter_all, get_file_cache, make_key
+
+logger = logging.getLogger(__name__)
+
+
+def local_upload_path(url: str) -> Path | None:
+    # Maps URLs served by our own /uploads mount back to the file on disk.
+    # Upload URLs are built from whatever host the client used (LAN address,
+    # proxy, deployed name), so any host counts as long as the file exists
+    # in upload_dir; blobs are named by content hash, so a match is the same file.
+    parsed = urlparse(url)
+    if parsed.scheme not in ("", "http", "https"):
+        return None
+    if not parsed.path.startswith("/uploads/"):
+        return None
+
+    upload_dir = Path(get_settings().upload_dir).resolve()
+    path = (upload_dir / unquote(parsed.path[len("/uploads/"):])).resolve()
+    if path.parent != upload_dir or not path.is_file():
+        return None
+    return path
+
+
+def _expected_size(response: httpx.Response, offset: int) -> int | None:
+    content_range = response.headers.get("content-range")
+    if content_range and "/" in content_range:
+        total = content_range.rsplit("/", 1)[1]
+        return int(total) if total.isdigit() else None
+    content_length = response.headers.get("content-length")
+    return offset + int(content_length) if content_length else None
+
+
+async def download_file(
+    url: str,
+    filepath: Path,
+    progress: Callable[[int, int | None], None] | None = None,
+    sha256: str | None = None,
+) -> str:
+    # Streams the body to a .part file in fixed-size chunks. A dropped
+    # connection resumes with a Range request from the bytes already on
+    # disk; the SHA-256 is computed on the way and checked if one is given.
+    settings = get_settings()
+    client = clients.http("downloads")
+    part_path = filepath.with_name(f"{filepath.name}.part")
+    digest = hashlib.sha256()
+    downloaded = 0
+    total = None
+    attempt = 0
+
+    try:
+        while True:
+            headers = {"Accept-Encoding": "identity"}
+            if downloaded:
+                headers["Range"] = f"bytes={downloaded}-"
+            try:
+                async with client.stream("GET", url, headers=headers, timeout=120.0) as response:
+                    if downloaded and response.status_code != 206:
+                        # Server ignored the range; start over
+                        downloaded = 0
+                        digest = hashlib.sha256()
+                    response.raise_for_status()
+                    total = _expected_size(response, downloaded)
+
+                    async with aiofiles.open(part_path, "ab" if downloaded else "wb") as f:
+                        async for chunk in response.aiter_raw(settings.download_chunk_size):
+                            await f.write(chunk)
+                            digest.update(chunk)
+                            downloaded += len(chunk)
+                            if progress:
+                                progress(downloaded, total)
+                break
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                retryable = isinstance(e, httpx.TransportError) or e.response.status_code >= 500
+                attempt += 1
+                if not retryable or attempt > settings.download_retries:
+                    raise
+                logger.warning(f"Download of {url} interrupted at {downloaded} bytes, retrying: {e}")
+                await asyncio.sleep(min(2 ** attempt, 10))
+
+        if total is not None and downloaded != total:
+            raise RuntimeError(f"Download of {url} incomplete: {downloaded} of {total} bytes")
+        actual = digest.hexdigest()
+        if sha256 is not None and actual != sha256:
+            raise RuntimeError(f"Checksum mismatch for {url}: expected {sha256}, got {actual}")
+        await aiofiles.os.replace(part_path, filepath)
+        return actual
+    except BaseException:
+        part_path.unlink(missing_ok=True)
+        raise
+
+
+def _download_cache() -> FileCache:
+    # Remote inputs downloaded once and kept under data_dir, bounded by disk
+    # use; evicting an entry deletes its file
+    settings = get_settings()
+    return get_file_cache(
+        "downloads",
+        Path(settings.data_dir) / "downloads",
+        max_entries=settings.download_cache_max_entries,
+        max_bytes=settings.download_cache_max_bytes,
+        max_age=settings.download_cache_max_age,
+    )
+
+
+async def _download_to_cache(key: str, url: str, suffix: str) -> dict:
+    cache = _download_cache()
+    with cache.writing(suffix) as tmp_path:
+        sha256 = await download_file(url, tmp_path)
+        # Named by URL, not content, so evicting one entry can't delete a
+        # file another entry still points at
+        return await cache.store(key, tmp_path, f"{key}{suffix}", sha256=sha256)
+
+
+@asynccontextmanager
+async def cached_download(url: str, suffix: str):
+    # Yields the content hash and local path of a remote file, downloading
+    # it only if it isn't cached yet. The file is pinned for the block, so a
+    # concurrent set evicting it can't delete it while it is still in use.
+    key = make_key(url, suffix)
+    cache = _download_cache()
+    with cache.pinned(f"{key}{suffix}"):
+        entry = await cache.lookup(key)
+        if entry is None:
+            entry = await cache.single_flight(key, lambda: _download_to_cache(key, url, suffix))
+        yield entry["sha256"], Path(entry["path"])
+
+
+@asynccontextmanager
+async def resolve_inputs(*inputs: tuple[str, str]):
+    # Yields one (local path, sha256) pair per (url, suffix): our own uploads
+    # are used in place with no digest (storage.content_hash is cheap for
+    # them), anything remote comes from the download cache (fetched
+    # concurrently the first time) and stays pinned until the block exits
+    @asynccontextmanager
+    async def resolve(url: str, suffix: str):
+        path = local_upload_path(url)
+        if path is not None:
+            yield path, None
+            return
+        async with cached_download(url, suffix) as (sha256, path):
+            yield path, sha256
+
+    async with AsyncExitStack() as stack:
+        yield await enter_all(stack, (resolve(url, suffix) for url, suffix in inputs))
@@ -0,0 +1,100 @@
+import sqlite3
+import time
+from contextlib import closing
+from pathlib import Path
+from fastapi.concurrency import run_in_threadpool
+
+from app.config import get_settings
+
+# Cloned ElevenLabs voices by the content hash of the recording they were
+# cloned from, so the same audio maps back to the same voice. last_used_at is
+# refreshed on every lookup and synthesis to pick eviction candidates.
+
+
+def _connect() -> sqlite3.Connection:
+    settings = get_settings()
+    data_dir = Path(settings.data_dir)
+    data_dir.mkdir(parents=True, exist_ok=True)
+
+    conn = sqlite3.connect(data_dir / "voices.sqlite", timeout=10.0)
+    conn.row_factory = sqlite3.Row
+    conn.execute(
+        """CREATE TABLE IF NOT EXISTS voices (
+            audio_sha256 TEXT PRIMARY KEY,
+            voice_id TEXT NOT NULL UNIQUE,
+            name TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            last_used_at REAL NOT NULL
+        )"""
+    )
+    return conn
+
+
+def _lookup_sync(audio_sha256: str) -> str | None:
+    with closing(_connect()) as conn, conn:
+        row = conn.execute(
+            "SELECT voice_id FROM voices WHERE audio_sha256 = ?", (audio_sha256,)
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "UPDATE voices SET last_used_at = ? WHERE audio_sha256 = ?",
+            (time.time(), audio_sha256),
+        )
+    return row["voice_id"]
+
+
+def _register_sync(audio_sha256: str, voice_id: str, name: str):
+    now = time.time()
+    with closing(_connect()) as conn, conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO voices VALUES (?, ?, ?, ?, ?)",
+            (audio_sha256, voice_id, name, now, now),
+        )
+
+
+def _touch_sync(voice_id: str):
+    with closing(_connect()) as conn, conn:
+        conn.execute("UPDATE voices SET last_used_at = ? WHERE voice_id = ?", (time.time(), voice_id))
+
+
+def _forget_sync(voice_id: str):
+    with closing(_connect()) as conn, conn:
+        conn.execute("DELETE FROM voices WHERE voice_id = ?", (voice_id,))
+
+
+def _count_sync() -> int:
+    with closing(_connect()) as conn:
+        return conn.execute("SELECT COUNT(*) FROM voices").fetchone()[0]
+
+
+def _least_recently_used_sync(limit: int) -> list[str]:
+    with closing(_connect()) as conn:
+        rows = conn.execute(
+            "SELECT voice_id FROM voices ORDER BY last_used_at LIMIT ?", (limit,)
+        ).fetchall()
+    return [row["voice_id"] for row in rows]
+
+
+async def lookup(audio_sha256: str) -> str | None:
+    return await run_in_threadpool(_lookup_sync, audio_sha256)
+
+
+async def register(audio_sha256: str, voice_id: str, name: str):
+    await run_in_threadpool(_register_sync, audio_sha256, voice_id, name)
+
+
+async def touch(voice_id: str):
+    await run_in_threadpool(_touch_sync, voice_id)
+
+
+async def forget(voice_id: str):
+    await run_in_threadpool(_forget_sync, voice_id)
+
+
+async def count() -> int:
+    return await run_in_threadpool(_count_sync)
+
+
+async def least_recently_used(limit: int) -> list[str]:
+    return await run_in_threadpool(_least_recently_used_sync, limit)
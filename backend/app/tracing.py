@@ -0,0 +1,57 @@
+import json
+import logging
+import queue
+import random
+import time
+from logging.handlers import QueueHandler, QueueListener
+from pathlib import Path
+
+from app.config import get_settings
+
+_logger = logging.getLogger("talkaz.trace")
+_logger.propagate = False
+_listener: QueueListener | None = None
+
+
+def start():
+    # Records are handed to a queue on the request path; a background thread
+    # owns the file handle and does the actual writes
+    global _listener
+    settings = get_settings()
+    if not settings.trace_log_path or _listener is not None:
+        return
+
+    path = Path(settings.trace_log_path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    file_handler = logging.FileHandler(path)
+    file_handler.setFormatter(logging.Formatter("%(message)s"))
+
+    records = queue.SimpleQueue()
+    _logger.addHandler(QueueHandler(records))
+    _logger.setLevel(logging.INFO)
+    _listener = QueueListener(records, file_handler)
+    _listener.start()
+
+
+def stop():
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _logger.handlers.clear()
+    _listener = None
+
+
+def trace(location: str, message: str, **data):
+    if _listener is None:
+        return
+    if random.random() >= get_settings().trace_sample_rate:
+        return
+    _logger.info(json.dumps({
+        "location": location,
+        "message": message,
+        "data": data,
+        "timestamp": int(time.time() * 1000),
+    }, default=str))
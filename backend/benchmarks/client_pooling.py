@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark: request latency with pooled vs per-request HTTP clients
+
+Hits a local stub server with the pattern the services used before
+(a fresh httpx.AsyncClient per call) and with the shared client from
+app.clients. The stub is plain HTTP, so this only measures TCP connect and
+client setup; against the real providers each unpooled call also pays for
+a TLS handshake.
+
+Usage:
+    cd backend
+    python -m benchmarks.client_pooling --requests 500 --concurrency 20
+"""
+
+import argparse
+import asyncio
+import time
+
+import httpx
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from benchmarks import stub_server
+
+
+def build_stub() -> Starlette:
+    async def tts(request):
+        return JSONResponse({"generations": []})
+
+    return Starlette(routes=[Route("/tts", tts, methods=["GET", "POST"])])
+
+
+async def run(url: str, requests: int, concurrency: int, pooled: bool) -> list[float]:
+    from app import clients
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            started = time.perf_counter()
+            if pooled:
+                response = await clients.http("hume").post(url, json={})
+            else:
+                async with httpx.AsyncClient() as client:
+                    response = await client.post(url, json={})
+            response.raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(one() for _ in range(requests)))
+    await clients.close_clients()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+
+    port = stub_server.free_port()
+    server = stub_server.start(build_stub, (), port, ready_path="/tts")
+    url = f"http://127.0.0.1:{port}/tts"
+
+    for pooled in (False, True):
+        started = time.perf_counter()
+        latencies = asyncio.run(run(url, args.requests, args.concurrency, pooled))
+        elapsed = time.perf_counter() - started
+        print(f"{'pooled  ' if pooled else 'unpooled'} requests={args.requests} "
+              f"concurrency={args.concurrency} wall={elapsed:.2f}s "
+              f"p50={stub_server.percentile(latencies, 50):.2f}ms "
+              f"p99={stub_server.percentile(latencies, 99):.2f}ms")
+
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
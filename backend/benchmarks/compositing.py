@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark: greenscreen compositing throughput per encoder profile
+
+Generates a green-screen clip (testsrc pattern on 0x00FF00 with a sine
+track) and a background still, then renders the composite with every
+profile in settings.encoder_profiles and reports frames per second. The
+"legacy" row is the previous filter graph: background rescaled on every
+frame, keying at full resolution, libx264 defaults.
+
+Usage:
+    cd backend
+    python -m benchmarks.compositing --seconds 5 --size 1280x720
+"""
+
+import argparse
+import asyncio
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from app.config import get_settings
+from app.services import ffmpeg, ffmpeg_pool, foregrounds
+
+
+def make_inputs(workdir: Path, seconds: float, size: str, rate: int) -> tuple[Path, Path]:
+    width, height = (int(v) for v in size.split("x"))
+    video_path = workdir / "greenscreen.mp4"
+    background_path = workdir / "room.jpg"
+    subject = f"{width // 3}x{height * 2 // 3}"
+    subprocess.run(
+        [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"color=c=0x00FF00:s={size}:r={rate}:d={seconds}[bg];"
+                                 f"testsrc=s={subject}:r={rate}:d={seconds}[subject];"
+                                 f"[bg][subject]overlay=(W-w)/2:H-h",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={seconds}",
+            "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-shortest",
+            str(video_path),
+        ],
+        check=True,
+    )
+    subprocess.run(
+        [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", "testsrc2=s=1920x1080",
+            "-frames:v", "1",
+            str(background_path),
+        ],
+        check=True,
+    )
+    return video_path, background_path
+
+
+def legacy_command(video_path: Path, background_path: Path, width: int, height: int, scale: float, output_path: Path) -> list[str]:
+    g = ffmpeg.composite_geometry(width, height, scale)
+    return [
+        "ffmpeg", "-y",
+        "-i", str(video_path),
+        "-loop", "1",
+        "-i", str(background_path),
+        "-filter_complex",
+        f"[1:v]scale={width}:{height}[bg];[0:v]chromakey=0x00FF00:0.3:0.1,scale={g['fg_width']}:{g['fg_height']}[fg];[bg][fg]overlay={g['x']}:{g['y']}",
+        "-c:a", "copy",
+        "-shortest",
+        str(output_path),
+    ]
+
+
+async def run(args):
+    width, height = (int(v) for v in args.size.split("x"))
+    frames = int(args.seconds * args.rate)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        video_path, background_path = make_inputs(workdir, args.seconds, args.size, args.rate)
+
+        renders = [("legacy", legacy_command(video_path, background_path, width, height, args.scale, workdir / "legacy.mp4"))]
+        for name, profile in get_settings().encoder_profiles.items():
+            geometry = ffmpeg.composite_geometry(width, height, args.scale, profile.get("max_height"))
+            output_path = workdir / f"{name}.mp4"
+            renders.append((name, ffmpeg._composite_command(
+                video_path, [background_path], geometry, str(args.rate), profile, [output_path],
+                foregrounds.chroma_key(), prescaled=False,
+            )))
+
+        print(f"threads per job: {ffmpeg_pool.threads_per_job()}, {frames} frames at {args.size}")
+        print(f"{'profile':<10} {'seconds':>8} {'fps':>8} {'output bytes':>13}")
+        for name, cmd in renders:
+            started = time.perf_counter()
+            await ffmpeg_pool.run(cmd)
+            elapsed = time.perf_counter() - started
+            size = (workdir / f"{name}.mp4").stat().st_size
+            print(f"{name:<10} {elapsed:>8.2f} {frames / elapsed:>8.1f} {size:>13}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--size", default="1280x720")
+    parser.add_argument("--rate", type=int, default=30)
+    parser.add_argument("--scale", type=float, default=0.6)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Benchmark: single-pass audio/video merge vs ffprobe + trim + mux
+
+Generates a testsrc clip and a sine-wave track with ffmpeg, then times
+each merge flow and counts the bytes it writes (intermediate files plus
+output; for the piped mode, the bytes read from ffmpeg's stdout).
+
+The trim-then-mux flow needs ffprobe on PATH and is skipped without it.
+
+Usage:
+    cd backend
+    python -m benchmarks.merge --runs 5 --video-seconds 20 --audio-seconds 15
+"""
+
+import argparse
+import asyncio
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from app.services import ffmpeg
+
+
+def make_inputs(workdir: Path, video_seconds: float, audio_seconds: float, size: str) -> tuple[Path, Path]:
+    video_path = workdir / "testsrc.mp4"
+    audio_path = workdir / "sine.mp3"
+    subprocess.run(
+        [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"testsrc=size={size}:rate=30:duration={video_seconds}",
+            "-f", "lavfi", "-i", f"sine=frequency=440:duration={video_seconds}",
+            "-c:v", "libx264", "-preset", "veryfast", "-pix_fmt", "yuv420p",
+            "-c:a", "aac",
+            str(video_path),
+        ],
+        check=True,
+    )
+    subprocess.run(
+        [
+            "ffmpeg", "-y", "-loglevel", "error",
+            "-f", "lavfi", "-i", f"sine=frequency=220:duration={audio_seconds}",
+            str(audio_path),
+        ],
+        check=True,
+    )
+    return video_path, audio_path
+
+
+async def trim_then_mux(video_path: Path, audio_path: Path, workdir: Path) -> int:
+    trimmed_path = workdir / "trimmed.mp4"
+    output_path = workdir / "legacy.mp4"
+    duration = await ffmpeg.get_audio_duration(audio_path)
+    await ffmpeg.trim_video(video_path, duration, trimmed_path)
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-y", "-loglevel", "error",
+        "-i", str(trimmed_path), "-i", str(audio_path),
+        "-c:v", "copy", "-c:a", "aac", str(output_path),
+    )
+    await process.wait()
+    written = trimmed_path.stat().st_size + output_path.stat().st_size
+    trimmed_path.unlink()
+    output_path.unlink()
+    return written
+
+
+async def single_pass(video_path: Path, audio_path: Path, workdir: Path) -> int:
+    output_path = workdir / "single.mp4"
+    await ffmpeg.mux_audio_video(video_path, audio_path, output_path)
+    written = output_path.stat().st_size
+    output_path.unlink()
+    return written
+
+
+async def piped(video_path: Path, audio_path: Path, workdir: Path) -> int:
+    written = 0
+    async for chunk in ffmpeg.stream_audio_video(video_path, audio_path):
+        written += len(chunk)
+    return written
+
+
+async def bench(flow, runs: int, video_path: Path, audio_path: Path, workdir: Path) -> tuple[list[float], int]:
+    timings = []
+    written = 0
+    for _ in range(runs):
+        started = time.perf_counter()
+        written = await flow(video_path, audio_path, workdir)
+        timings.append((time.perf_counter() - started) * 1000)
+    return timings, written
+
+
+async def run(args):
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        video_path, audio_path = make_inputs(workdir, args.video_seconds, args.audio_seconds, args.size)
+
+        flows = [("single-pass", single_pass), ("piped", piped)]
+        if shutil.which("ffprobe"):
+            flows.insert(0, ("trim+mux", trim_then_mux))
+        else:
+            print("ffprobe not found, skipping trim+mux")
+
+        print(f"{'flow':<12} {'median ms':>10} {'min ms':>10} {'bytes written':>14}")
+        for name, flow in flows:
+            timings, written = await bench(flow, args.runs, video_path, audio_path, workdir)
+            print(f"{name:<12} {statistics.median(timings):>10.1f} {min(timings):>10.1f} {written:>14}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--video-seconds", type=float, default=20)
+    parser.add_argument("--audio-seconds", type=float, default=15)
+    parser.add_argument("--size", default="1280x720")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /health latency while many /video/status polls are in flight
+
+Starts a local stub of the Replicate predictions API that answers after a
+fixed delay, then fires concurrent status polls against the app and samples
+/health the whole time. "blocking" mode reproduces the old synchronous SDK
+call inside the async endpoint for comparison.
+
+Usage:
+    cd backend
+    python -m benchmarks.status_polling --polls 200 --delay 0.5
+    python -m benchmarks.status_polling --polls 20 --mode blocking  # old behaviour, serialises polls
+"""
+
+import argparse
+import asyncio
+import os
+import time
+
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+from benchmarks import stub_server
+
+
+def build_stub(delay: float) -> Starlette:
+    async def prediction(request):
+        await asyncio.sleep(delay)
+        return JSONResponse({
+            "id": request.path_params["prediction_id"],
+            "model": "kwaivgi/kling-v2.5-turbo-pro",
+            "version": "stub",
+            "status": "processing",
+            "input": {},
+            "output": None,
+            "logs": "",
+            "error": None,
+            "metrics": {},
+            "created_at": None,
+            "started_at": None,
+            "completed_at": None,
+            "urls": {},
+        })
+
+    return Starlette(routes=[Route("/v1/predictions/{prediction_id}", prediction)])
+
+
+async def run(polls: int, mode: str) -> list[float]:
+    import httpx
+    from app import clients
+    from app.main import app
+    from app.services import replicate
+
+    if mode == "blocking":
+        import replicate as replicate_sdk
+
+        sync_client = replicate_sdk.Client()
+
+        async def blocking_status(prediction_id: str) -> dict:
+            prediction = sync_client.predictions.get(prediction_id)
+            return {"status": prediction.status, "output": None, "error": prediction.error}
+
+        replicate.get_prediction_status = blocking_status
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        done = asyncio.Event()
+        latencies = []
+
+        async def sample_health():
+            while not done.is_set():
+                started = time.perf_counter()
+                response = await client.get("/health")
+                response.raise_for_status()
+                latencies.append((time.perf_counter() - started) * 1000)
+                await asyncio.sleep(0.01)
+
+        async def poll(i: int):
+            response = await client.get(f"/api/v1/video/status/bench-{i}")
+            response.raise_for_status()
+
+        sampler = asyncio.create_task(sample_health())
+        await asyncio.gather(*(poll(i) for i in range(polls)))
+        done.set()
+        await sampler
+
+    await clients.close_clients()
+    return latencies
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--polls", type=int, default=200)
+    parser.add_argument("--delay", type=float, default=0.5)
+    parser.add_argument("--mode", choices=["async", "blocking"], default="async")
+    args = parser.parse_args()
+
+    port = stub_server.free_port()
+    server = stub_server.start(build_stub, (args.delay,), port)
+    os.environ["REPLICATE_BASE_URL"] = f"http://127.0.0.1:{port}"
+    os.environ["REPLICATE_API_TOKEN"] = "bench"
+
+    started = time.perf_counter()
+    latencies = asyncio.run(run(args.polls, args.mode))
+    elapsed = time.perf_counter() - started
+    server.terminate()
+
+    print(f"mode={args.mode} polls={args.polls} upstream_delay={args.delay}s wall={elapsed:.2f}s")
+    print(f"/health samples={len(latencies)} "
+          f"p50={stub_server.percentile(latencies, 50):.1f}ms "
+          f"p99={stub_server.percentile(latencies, 99):.1f}ms "
+          f"max={max(latencies):.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
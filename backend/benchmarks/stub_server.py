@@ -0,0 +1,37 @@
+import multiprocessing
+import socket
+import time
+
+import httpx
+import uvicorn
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _serve(factory, args: tuple, port: int):
+    uvicorn.run(factory(*args), host="127.0.0.1", port=port, log_level="warning")
+
+
+def start(factory, args: tuple, port: int, ready_path: str = "/") -> multiprocessing.Process:
+    # Separate process so the stub doesn't compete with the app for the GIL
+    process = multiprocessing.Process(target=_serve, args=(factory, args, port), daemon=True)
+    process.start()
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}{ready_path}", timeout=1.0)
+            return process
+        except httpx.TransportError:
+            time.sleep(0.05)
+    process.terminate()
+    raise RuntimeError("Stub server did not start")
+
+
+def percentile(values: list[float], pct: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
@@ -0,0 +1,30 @@
+import pytest
+
+from app.config import get_settings
+from app.services import cache, prediction_store
+from app.services.storage import get_storage
+
+
+@pytest.fixture(autouse=True)
+def settings(tmp_path, monkeypatch):
+    # Every test gets its own upload and data directories (and so its own
+    # SQLite files), with the cached settings, storage and caches rebuilt
+    monkeypatch.setenv("UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setenv("DATA_DIR", str(tmp_path / "data"))
+    get_settings.cache_clear()
+    get_storage.cache_clear()
+    cache._caches.clear()
+    yield get_settings()
+    get_settings.cache_clear()
+    get_storage.cache_clear()
+    cache._caches.clear()
+
+
+@pytest.fixture(autouse=True)
+def clean_prediction_store():
+    # prediction_store keeps its state in module-level dicts
+    yield
+    for store in (prediction_store._terminal, prediction_store._in_flight,
+                  prediction_store._fetched_at, prediction_store._last_requested,
+                  prediction_store._fetches, prediction_store._webhooked):
+        store.clear()
@@ -0,0 +1,160 @@
+import asyncio
+import hashlib
+from pathlib import Path
+
+from app.services import cache, replicate, url_resolver
+from app.services.cache import ResultCache, make_key
+
+
+def test_make_key_is_stable_and_order_sensitive():
+    assert make_key("a", 1, {"x": 1, "y": 2}) == make_key("a", 1, {"y": 2, "x": 1})
+    assert make_key("a", "b") != make_key("b", "a")
+
+
+def test_hits_misses_and_persistence():
+    results = ResultCache("t", max_entries=10)
+    assert results.get_sync("k") is None
+    results.set_sync("k", {"v": 1})
+    assert results.get_sync("k") == {"v": 1}
+    assert results.stats()["hits"] == 1
+    assert results.stats()["misses"] == 1
+    assert results.stats()["hit_rate"] == 0.5
+
+    # Same SQLite file, new instance (as after a restart)
+    assert ResultCache("t", max_entries=10).get_sync("k") == {"v": 1}
+
+
+def test_least_recently_used_entry_is_evicted(monkeypatch):
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr(cache.time, "time", lambda: next(clock))
+    evicted = []
+    results = ResultCache("t", max_entries=2, on_evict=evicted.append)
+    results.set_sync("a", {"v": "a"})
+    results.set_sync("b", {"v": "b"})
+    results.get_sync("a")
+    results.set_sync("c", {"v": "c"})
+
+    assert evicted == [{"v": "b"}]
+    assert results.get_sync("b") is None
+    assert results.get_sync("a") == {"v": "a"}
+    assert results.stats()["evictions"] == 1
+
+
+def test_byte_limit_evicts_until_it_fits(monkeypatch):
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr(cache.time, "time", lambda: next(clock))
+    evicted = []
+    results = ResultCache("t", max_entries=100, max_bytes=100, on_evict=evicted.append)
+    results.set_sync("a", {"v": "a"}, size=60)
+    results.set_sync("b", {"v": "b"}, size=30)
+    results.set_sync("c", {"v": "c"}, size=50)
+
+    assert evicted == [{"v": "a"}]
+    assert results.stats()["bytes"] == 80
+
+
+def test_entries_expire_after_max_age(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "time", lambda: now[0])
+    results = ResultCache("t", max_entries=10, max_age=60, memory_entries=10)
+    results.set_sync("k", {"v": 1})
+
+    now[0] += 59
+    assert results.get_sync("k") == {"v": 1}
+    now[0] += 2
+    assert results.get_sync("k") is None
+
+
+def test_create_image_caches_the_stored_copy(monkeypatch):
+    runs = []
+
+    class Client:
+        async def async_run(self, model, input):
+            runs.append(model)
+            return "https://replicate.delivery/out.png"
+
+    async def download_file(url, path, *args, **kwargs):
+        path.write_bytes(b"generated image")
+        return hashlib.sha256(b"generated image").hexdigest()
+
+    monkeypatch.setattr(replicate, "_get_client", lambda: Client())
+    monkeypatch.setattr(replicate, "download_file", download_file)
+
+    first = asyncio.run(replicate.create_image("https://example.com/selfie.jpg", "Anime"))
+    second = asyncio.run(replicate.create_image("https://example.com/selfie.jpg", "Anime"))
+    uncached = asyncio.run(replicate.create_image("https://example.com/selfie.jpg", "Anime", use_cache=False))
+
+    expected = f"/uploads/{hashlib.sha256(b'generated image').hexdigest()}.png"
+    assert first == second == uncached == expected
+    assert runs == [replicate.IMAGE_MODEL, replicate.IMAGE_MODEL]
+
+
+def test_oversized_entry_is_rejected_without_evicting_others():
+    evicted = []
+    results = ResultCache("t", max_entries=10, max_bytes=100, on_evict=evicted.append)
+    results.set_sync("a", {"v": "a"}, size=60)
+    results.set_sync("big", {"v": "big"}, size=150)
+
+    assert evicted == [{"v": "big"}]
+    assert results.get_sync("big") is None
+    assert results.get_sync("a") == {"v": "a"}
+
+
+def test_oversized_file_survives_while_pinned(tmp_path):
+    files = cache.FileCache("files", tmp_path / "files", max_entries=10, max_bytes=10)
+    with files.pinned("big.bin") as path:
+        with files.writing(".bin") as tmp:
+            tmp.write_bytes(b"x" * 20)
+            asyncio.run(files.store("big", tmp, "big.bin"))
+        # Not kept in the index, but the caller can still use the file
+        assert asyncio.run(files.lookup("big")) is None
+        assert path.read_bytes() == b"x" * 20
+    assert not path.exists()
+
+
+def test_pinned_file_outlives_its_eviction(tmp_path, monkeypatch):
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr(cache.time, "time", lambda: next(clock))
+    files = cache.FileCache("files", tmp_path / "files", max_entries=1)
+
+    async def put(key):
+        with files.writing(".bin") as tmp:
+            tmp.write_bytes(key.encode())
+            return Path((await files.store(key, tmp, f"{key}.bin"))["path"])
+
+    with files.pinned("a.bin"):
+        a = asyncio.run(put("a"))
+        with files.pinned("a.bin"):
+            b = asyncio.run(put("b"))
+            assert asyncio.run(files.lookup("a")) is None
+        # Still pinned by the outer block
+        assert a.exists()
+    assert not a.exists()
+    assert b.exists()
+
+    # Unpinned entries are deleted on eviction as before
+    asyncio.run(put("c"))
+    assert not b.exists()
+
+
+def test_resolved_download_is_kept_until_the_block_exits(monkeypatch, settings):
+    settings.download_cache_max_entries = 1
+
+    async def download_file(url, path, progress=None, sha256=None):
+        path.write_bytes(url.encode())
+        return hashlib.sha256(url.encode()).hexdigest()
+
+    monkeypatch.setattr(url_resolver, "download_file", download_file)
+
+    async def run():
+        async with url_resolver.resolve_inputs(("https://cdn/a.mp4", ".mp4")) as ((a, a_hash),):
+            assert a_hash == hashlib.sha256(b"https://cdn/a.mp4").hexdigest()
+            # Another job's download pushes this one out of the cache meanwhile
+            async with url_resolver.resolve_inputs(("https://cdn/b.mp4", ".mp4")) as ((b, _),):
+                pass
+            assert a.read_bytes() == b"https://cdn/a.mp4"
+        return a, b
+
+    a, b = asyncio.run(run())
+    assert not a.exists()
+    assert b.exists()
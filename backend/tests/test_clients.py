@@ -0,0 +1,15 @@
+import httpx
+
+from app import clients
+
+
+def test_replicate_pool_only_backs_the_async_client():
+    client = clients.replicate_client()
+    pooled = clients._transports[-1]
+    try:
+        assert client._async_client._transport._wrapped_transport is pooled
+        # Sync calls must not be handed the async-only transport
+        assert isinstance(client._client._transport._wrapped_transport, httpx.HTTPTransport)
+    finally:
+        clients._sdk.pop("replicate", None)
+        clients._transports.remove(pooled)
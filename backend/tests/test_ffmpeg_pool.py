@@ -0,0 +1,103 @@
+import asyncio
+
+import pytest
+
+from app.services import ffmpeg_pool
+
+
+@pytest.fixture(autouse=True)
+def one_process(settings):
+    settings.ffmpeg_max_processes = 1
+    settings.ffmpeg_threads_per_job = 2
+    yield
+    assert ffmpeg_pool._running == 0
+
+
+def test_waiters_run_by_priority_then_arrival():
+    order = []
+
+    async def job(name, priority, started):
+        async with ffmpeg_pool.slot(priority):
+            started.set()
+            order.append(name)
+            await asyncio.sleep(0.01)
+
+    async def run():
+        first_started = asyncio.Event()
+        first = asyncio.create_task(job("first", ffmpeg_pool.PRIORITY_LOW, first_started))
+        await first_started.wait()
+        # Queued while the only slot is busy
+        queued = [
+            asyncio.create_task(job(name, priority, asyncio.Event()))
+            for name, priority in [
+                ("low", ffmpeg_pool.PRIORITY_LOW),
+                ("normal", ffmpeg_pool.PRIORITY_NORMAL),
+                ("high-1", ffmpeg_pool.PRIORITY_HIGH),
+                ("high-2", ffmpeg_pool.PRIORITY_HIGH),
+            ]
+        ]
+        await asyncio.gather(first, *queued)
+
+    asyncio.run(run())
+    assert order == ["first", "high-1", "high-2", "normal", "low"]
+
+
+def test_queue_wait_times_out():
+    async def run():
+        held = asyncio.Event()
+        release = asyncio.Event()
+
+        async def holder():
+            async with ffmpeg_pool.slot():
+                held.set()
+                await release.wait()
+
+        task = asyncio.create_task(holder())
+        await held.wait()
+        with pytest.raises(ffmpeg_pool.FFmpegQueueTimeout):
+            async with ffmpeg_pool.slot(timeout=0.05):
+                pass
+        release.set()
+        await task
+
+        # The timed-out waiter didn't take the slot with it
+        async with ffmpeg_pool.slot(timeout=0.05) as threads:
+            assert threads == 2
+
+    asyncio.run(run())
+
+
+def test_cancelled_waiter_does_not_block_the_queue():
+    async def run():
+        held = asyncio.Event()
+        release = asyncio.Event()
+
+        async def holder():
+            async with ffmpeg_pool.slot():
+                held.set()
+                await release.wait()
+
+        async def waiter():
+            async with ffmpeg_pool.slot():
+                pass
+
+        task = asyncio.create_task(holder())
+        await held.wait()
+        cancelled = asyncio.create_task(waiter())
+        await asyncio.sleep(0)
+        cancelled.cancel()
+        await asyncio.gather(cancelled, return_exceptions=True)
+        release.set()
+        await task
+        await asyncio.wait_for(waiter(), timeout=1)
+
+    asyncio.run(run())
+
+
+def test_with_threads_sets_filter_and_output_threads():
+    assert ffmpeg_pool.with_threads(["ffmpeg", "-i", "in.mp4", "out.mp4"], 2) == [
+        "ffmpeg", "-filter_threads", "2", "-i", "in.mp4", "-threads", "2", "out.mp4",
+    ]
+    # Multi-output commands set -threads per output themselves
+    cmd = ["ffmpeg", "-i", "in.mp4", "-threads", "1", "a.mp4", "-threads", "1", "b.mp4"]
+    assert ffmpeg_pool.with_threads(cmd, 2) == ["ffmpeg", "-filter_threads", "2", *cmd[1:]]
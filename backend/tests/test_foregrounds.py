@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from app.services import foregrounds
+from app.services.storage import get_storage
+
+GEOMETRY = {"fg_width": 384, "fg_height": 216}
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "greenscreen.mp4"
+    path.write_bytes(b"not really a video")
+    return path
+
+
+def test_chroma_key_normalizes_color():
+    assert foregrounds.chroma_key("#00ff00")["color"] == "0x00FF00"
+    assert foregrounds.chroma_key("1a2b3c", 0.2, 0.05) == {"color": "0x1A2B3C", "similarity": 0.2, "blend": 0.05}
+    with pytest.raises(ValueError):
+        foregrounds.chroma_key("green")
+
+
+def test_key_depends_on_key_parameters_and_size(video):
+    key = foregrounds.chroma_key()
+    base = asyncio.run(foregrounds.cache_key(video, GEOMETRY, key))
+
+    same = asyncio.run(foregrounds.cache_key(video, dict(GEOMETRY), foregrounds.chroma_key("#00FF00")))
+    other_color = asyncio.run(foregrounds.cache_key(video, GEOMETRY, foregrounds.chroma_key("0x0000FF")))
+    other_similarity = asyncio.run(foregrounds.cache_key(video, GEOMETRY, foregrounds.chroma_key(similarity=0.4)))
+    other_size = asyncio.run(foregrounds.cache_key(video, {"fg_width": 192, "fg_height": 108}, key))
+
+    assert same == base
+    assert len({base, other_color, other_similarity, other_size}) == 4
+
+
+async def _stored(cache_key):
+    async with foregrounds.stored(cache_key) as path:
+        return path
+
+
+def test_stored_foreground_is_found_by_content(video, tmp_path):
+    key = foregrounds.chroma_key()
+    cache_key = asyncio.run(foregrounds.cache_key(video, GEOMETRY, key))
+    assert asyncio.run(_stored(cache_key)) is None
+
+    with foregrounds.writing() as keyed:
+        keyed.write_bytes(b"ffv1 with alpha")
+        path = asyncio.run(foregrounds.store(cache_key, keyed))
+
+    # A copy of the same video elsewhere maps to the same foreground
+    copy = tmp_path / "copy.mp4"
+    copy.write_bytes(video.read_bytes())
+    assert asyncio.run(foregrounds.cache_key(copy, GEOMETRY, key)) == cache_key
+    assert asyncio.run(_stored(cache_key)) == path
+
+
+def test_eviction_deletes_the_file(video, settings):
+    settings.foreground_cache_max_bytes = 20
+    key = foregrounds.chroma_key()
+    paths = []
+    for width in (100, 200):
+        cache_key = asyncio.run(foregrounds.cache_key(video, {"fg_width": width, "fg_height": 100}, key))
+        with foregrounds.writing() as keyed:
+            keyed.write_bytes(b"x" * 15)
+            paths.append(asyncio.run(foregrounds.store(cache_key, keyed)))
+
+    assert not paths[0].exists()
+    assert paths[1].exists()
+
+
+def test_known_digest_skips_hashing_the_video(video, monkeypatch):
+    key = foregrounds.chroma_key()
+    digest = asyncio.run(get_storage().content_hash(video))
+
+    async def content_hash(path):
+        raise AssertionError("video was rehashed")
+
+    monkeypatch.setattr(get_storage(), "content_hash", content_hash)
+    assert asyncio.run(foregrounds.cache_key(video, GEOMETRY, key, digest)) == foregrounds.make_key(
+        digest, key, GEOMETRY["fg_width"], GEOMETRY["fg_height"],
+    )
@@ -0,0 +1,118 @@
+import asyncio
+
+import pytest
+
+from app.services import jobs, prediction_store, replicate
+
+
+def _job(request: dict) -> dict:
+    return {
+        "id": "job-1",
+        "status": "running",
+        "request": request,
+        "stages": {
+            name: {"status": "pending", "output": {}, "error": None, "started_at": None, "finished_at": None}
+            for name in jobs._stage_graph(request)
+        },
+        "output_url": None,
+        "error": None,
+        "created_at": 0.0,
+        "updated_at": 0.0,
+    }
+
+
+def test_stage_graph_adds_optional_stages():
+    assert jobs._stage_graph({}) == {
+        "image": [],
+        "voice": [],
+        "video": ["image"],
+        "lipsync": ["video", "voice"],
+    }
+    graph = jobs._stage_graph({"scene_description": "rooftop", "background_url": "/uploads/bg.jpg"})
+    assert graph["video"] == ["image", "prompt"]
+    assert graph["background"] == ["lipsync"]
+
+
+def test_stages_start_once_dependencies_succeed(monkeypatch):
+    order = []
+
+    def runner(name):
+        async def run(job, stage):
+            order.append(f"{name}:start")
+            await asyncio.sleep(0.01)
+            order.append(f"{name}:end")
+            return {"name": name}
+        return run
+
+    graph = {"a": [], "b": [], "c": ["a", "b"]}
+    monkeypatch.setattr(jobs, "_STAGE_RUNNERS", {name: runner(name) for name in graph})
+    monkeypatch.setattr(jobs, "_stage_provider", lambda name, request: name)
+    job = _job({})
+    job["stages"] = {name: {"status": "pending", "output": {}} for name in graph}
+
+    asyncio.run(jobs._run_stages(job, graph))
+
+    # a and b overlap, c only starts after both have finished
+    assert order.index("b:start") < order.index("a:end")
+    assert order.index("c:start") > max(order.index("a:end"), order.index("b:end"))
+    assert all(stage["status"] == "succeeded" for stage in job["stages"].values())
+
+
+def test_failed_stage_stops_the_job(monkeypatch):
+    async def fail(job, stage):
+        raise RuntimeError("upstream down")
+
+    async def never(job, stage):
+        raise AssertionError("dependent stage must not run")
+
+    graph = {"a": [], "b": ["a"]}
+    monkeypatch.setattr(jobs, "_STAGE_RUNNERS", {"a": fail, "b": never})
+    monkeypatch.setattr(jobs, "_stage_provider", lambda name, request: name)
+    job = _job({})
+    job["stages"] = {name: {"status": "pending", "output": {}} for name in graph}
+
+    with pytest.raises(RuntimeError, match="upstream down"):
+        asyncio.run(jobs._run_stages(job, graph))
+    assert job["stages"]["a"]["status"] == "failed"
+    assert job["stages"]["a"]["error"] == "upstream down"
+    assert job["stages"]["b"]["status"] == "pending"
+
+
+def test_provider_slot_is_released_while_waiting_on_prediction(monkeypatch):
+    async def create_video_prediction(**kwargs):
+        return {"id": "pred-1", "status": "starting"}
+
+    async def run():
+        jobs._providers.clear()
+        jobs._providers["replicate"] = asyncio.Semaphore(1)
+        prediction_released = asyncio.Event()
+        wait_started = asyncio.Event()
+
+        async def wait(prediction_id, poll_interval):
+            wait_started.set()
+            await prediction_released.wait()
+            return {"id": prediction_id, "status": "succeeded", "output": "https://out/video.mp4"}
+
+        monkeypatch.setattr(replicate, "create_video_prediction", create_video_prediction)
+        monkeypatch.setattr(prediction_store, "wait", wait)
+
+        job = _job({"spoken_line": "hi", "duration": 5.0, "style": "Anime"})
+        job["stages"]["image"] = {"status": "succeeded", "output": {"image_url": "/uploads/a.png"}}
+        video = asyncio.create_task(jobs._run_stage(job, "video"))
+        try:
+            await asyncio.wait_for(wait_started.wait(), timeout=1)
+            # Another Replicate stage can take the only slot while the video waits
+            await asyncio.wait_for(jobs._providers["replicate"].acquire(), timeout=1)
+            jobs._providers["replicate"].release()
+
+            prediction_released.set()
+            await video
+        finally:
+            video.cancel()
+            await asyncio.gather(video, return_exceptions=True)
+        return job
+
+    job = asyncio.run(run())
+    assert job["stages"]["video"]["status"] == "succeeded"
+    assert job["stages"]["video"]["output"] == {"prediction_id": "pred-1", "video_url": "https://out/video.mp4"}
+    jobs._providers.clear()
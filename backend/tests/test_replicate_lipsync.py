@@ -0,0 +1,113 @@
+import asyncio
+import types
+
+import pytest
+
+from app.services import jobs, prediction_store, replicate
+from app.services.storage import get_storage
+
+
+@pytest.fixture
+def client(monkeypatch):
+    calls = {"uploads": [], "predictions": []}
+
+    class Files:
+        async def async_create(self, path):
+            calls["uploads"].append(path.name)
+            return types.SimpleNamespace(urls={"get": f"https://api.replicate.com/v1/files/{path.name}"})
+
+    class Predictions:
+        async def async_create(self, model, input, **kwargs):
+            calls["predictions"].append({"model": model, "input": input, **kwargs})
+            return types.SimpleNamespace(id=f"p{len(calls['predictions'])}", status="starting")
+
+    monkeypatch.setattr(replicate, "_get_client", lambda: types.SimpleNamespace(files=Files(), predictions=Predictions()))
+    return calls
+
+
+def test_local_audio_is_uploaded_once(client):
+    blob = asyncio.run(get_storage().put_bytes(b"voice", ".mp3"))
+
+    for _ in range(2):
+        result = asyncio.run(replicate.create_lipsync_prediction("https://out/video.mp4", blob["url"]))
+        assert result["status"] == "starting"
+
+    assert client["uploads"] == [blob["name"]]
+    assert [p["input"]["audio_file"] for p in client["predictions"]] == [
+        f"https://api.replicate.com/v1/files/{blob['name']}"
+    ] * 2
+    assert client["predictions"][0]["model"] == replicate.LIPSYNC_MODEL
+
+
+def test_public_base_url_and_remote_audio_skip_the_upload(client, settings):
+    blob = asyncio.run(get_storage().put_bytes(b"voice", ".mp3"))
+    settings.public_base_url = "https://api.example.com/"
+
+    asyncio.run(replicate.create_lipsync_prediction("https://out/video.mp4", blob["url"]))
+    asyncio.run(replicate.create_lipsync_prediction("https://out/video.mp4", "https://cdn.example.com/a.mp3"))
+
+    assert client["uploads"] == []
+    assert [p["input"]["audio_file"] for p in client["predictions"]] == [
+        f"https://api.example.com/uploads/{blob['name']}",
+        "https://cdn.example.com/a.mp3",
+    ]
+
+
+def test_lipsync_stage_checkpoints_and_waits(client, monkeypatch):
+    saved = []
+    waited = []
+
+    async def save(job):
+        saved.append(dict(job["stages"]["lipsync"]["output"]))
+
+    async def wait(prediction_id, poll_interval):
+        waited.append(prediction_id)
+        assert prediction_store.is_tracked(prediction_id)
+        return {"id": prediction_id, "status": "succeeded", "output": "https://out/synced.mp4", "error": None}
+
+    monkeypatch.setattr(jobs, "_save", save)
+    monkeypatch.setattr(prediction_store, "wait", wait)
+    job = {"stages": {
+        "video": {"output": {"video_url": "https://out/video.mp4"}},
+        "voice": {"output": {"audio_url": "https://cdn.example.com/a.mp3"}},
+        "lipsync": {"output": {}},
+    }}
+
+    output = asyncio.run(jobs._run_lipsync(job, job["stages"]["lipsync"]))
+
+    assert output == {"prediction_id": "p1", "video_url": "https://out/synced.mp4"}
+    assert saved == [{"prediction_id": "p1"}]
+    assert waited == ["p1"]
+
+    # A resumed stage waits on the checkpointed prediction instead of starting another
+    asyncio.run(jobs._run_lipsync(job, {"output": {"prediction_id": "p1"}}))
+    assert len(client["predictions"]) == 1
+
+
+def test_failed_lipsync_prediction_fails_the_stage(client, monkeypatch):
+    async def wait(prediction_id, poll_interval):
+        return {"id": prediction_id, "status": "failed", "output": None, "error": "audio too long"}
+
+    async def save(job):
+        pass
+
+    monkeypatch.setattr(jobs, "_save", save)
+    monkeypatch.setattr(prediction_store, "wait", wait)
+    job = {"stages": {
+        "video": {"output": {"video_url": "https://out/video.mp4"}},
+        "voice": {"output": {"audio_url": "https://cdn.example.com/a.mp3"}},
+    }}
+
+    with pytest.raises(RuntimeError, match="audio too long"):
+        asyncio.run(jobs._run_lipsync(job, {"output": {}}))
+
+
+def test_wait_polls_until_terminal(monkeypatch):
+    statuses = iter(["starting", "processing", "succeeded"])
+
+    async def get_status(prediction_id):
+        return {"id": prediction_id, "status": next(statuses), "output": None, "error": None}
+
+    monkeypatch.setattr(prediction_store, "get_status", get_status)
+
+    assert asyncio.run(prediction_store.wait("p1", 0))["status"] == "succeeded"
@@ -0,0 +1,68 @@
+import asyncio
+import hashlib
+
+import pytest
+
+from app.services.storage import get_storage
+
+
+def test_identical_bytes_are_stored_once():
+    storage = get_storage()
+    first = asyncio.run(storage.put_bytes(b"same selfie", ".jpg"))
+    second = asyncio.run(storage.put_bytes(b"same selfie", ".jpg"))
+
+    assert first["sha256"] == hashlib.sha256(b"same selfie").hexdigest()
+    assert second["url"] == first["url"] == f"/uploads/{first['sha256']}.jpg"
+    assert [p.name for p in storage.root.iterdir() if not p.name.startswith(".")] == [first["name"]]
+
+
+def test_put_file_renames_into_place_and_drops_duplicates():
+    storage = get_storage()
+    source = storage.temp_path(".mp3")
+    source.write_bytes(b"audio")
+    blob = asyncio.run(storage.put_file(source, ".mp3"))
+
+    assert not source.exists()
+    assert blob["path"].read_bytes() == b"audio"
+
+    duplicate = storage.temp_path(".mp3")
+    duplicate.write_bytes(b"audio")
+    again = asyncio.run(storage.put_file(duplicate, ".mp3"))
+
+    assert again["path"] == blob["path"]
+    assert not duplicate.exists()
+
+
+def test_lookup_misses_when_the_blob_file_is_gone():
+    storage = get_storage()
+    blob = asyncio.run(storage.put_bytes(b"gone", ".png"))
+    assert asyncio.run(storage.lookup(blob["sha256"]))["path"] == blob["path"]
+
+    blob["path"].unlink()
+
+    assert asyncio.run(storage.lookup(blob["sha256"])) is None
+
+
+def test_content_hash_of_stored_and_outside_files(tmp_path):
+    storage = get_storage()
+    blob = asyncio.run(storage.put_bytes(b"stored", ".png"))
+    outside = tmp_path / "other.png"
+    outside.write_bytes(b"outside")
+
+    assert asyncio.run(storage.content_hash(blob["path"])) == blob["sha256"]
+    assert asyncio.run(storage.content_hash(outside)) == hashlib.sha256(b"outside").hexdigest()
+
+
+def test_scratch_is_removed_on_error_and_after_put_file():
+    storage = get_storage()
+    with pytest.raises(RuntimeError):
+        with storage.scratch(".mp4") as path:
+            path.write_bytes(b"partial")
+            raise RuntimeError("ffmpeg failed")
+    assert not path.exists()
+
+    with storage.scratch(".mp4") as path:
+        path.write_bytes(b"done")
+        blob = asyncio.run(storage.put_file(path, ".mp4"))
+    assert blob["path"].exists()
+    assert not list(storage.root.glob(".work-*"))
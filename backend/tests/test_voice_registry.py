@@ -0,0 +1,91 @@
+import asyncio
+from pathlib import Path
+
+import pytest
+from elevenlabs.core.api_error import ApiError
+
+from app.services import elevenlabs, voice_registry
+from app.services.storage import get_storage
+
+
+@pytest.fixture
+def upstream(settings, monkeypatch):
+    # Fake ElevenLabs account: clone hands out v1, v2, ...; deletes are recorded
+    settings.elevenlabs_max_cloned_voices = 2
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr(voice_registry.time, "time", lambda: next(clock))
+    monkeypatch.setattr(elevenlabs, "_clone_lock", asyncio.Lock())
+    account = {"cloned": 0, "deleted": [], "delete_errors": {}}
+
+    async def clone_voice(audio_path, name):
+        account["cloned"] += 1
+        return f"v{account['cloned']}"
+
+    async def delete_voice(voice_id):
+        account["deleted"].append(voice_id)
+        if voice_id in account["delete_errors"]:
+            raise ApiError(status_code=account["delete_errors"][voice_id])
+
+    monkeypatch.setattr(elevenlabs, "clone_voice", clone_voice)
+    monkeypatch.setattr(elevenlabs, "delete_voice", delete_voice)
+    return account
+
+
+def _clone(sha: str) -> str:
+    return asyncio.run(elevenlabs.get_or_clone_voice(Path("recording.mp3"), sha * 64))
+
+
+def test_same_recording_reuses_the_voice(upstream):
+    async def clone_concurrently():
+        return await asyncio.gather(*(
+            elevenlabs.get_or_clone_voice(Path("recording.mp3"), "a" * 64) for _ in range(3)
+        ))
+
+    assert asyncio.run(clone_concurrently()) == ["v1", "v1", "v1"]
+    assert _clone("a") == "v1"
+    assert upstream["cloned"] == 1
+
+
+def test_least_recently_used_voice_is_deleted_at_the_limit(upstream):
+    assert _clone("a") == "v1"
+    assert _clone("b") == "v2"
+    asyncio.run(voice_registry.touch("v1"))
+
+    assert _clone("c") == "v3"
+    assert upstream["deleted"] == ["v2"]
+    assert asyncio.run(voice_registry.count()) == 2
+
+
+def test_voice_gone_upstream_is_forgotten(upstream):
+    _clone("a")
+    _clone("b")
+    upstream["delete_errors"]["v1"] = 404
+
+    _clone("c")
+
+    assert asyncio.run(voice_registry.lookup("a" * 64)) is None
+    assert asyncio.run(voice_registry.count()) == 2
+
+
+def test_failed_delete_keeps_the_voice(upstream):
+    _clone("a")
+    _clone("b")
+    upstream["delete_errors"]["v1"] = 400
+
+    _clone("c")
+
+    # v1 may still count against the account, so it stays registered
+    assert asyncio.run(voice_registry.lookup("a" * 64)) == "v1"
+    assert asyncio.run(voice_registry.count()) == 3
+
+
+def test_speech_cache_hit_counts_as_use(upstream):
+    _clone("a")
+    _clone("b")
+    blob = asyncio.run(get_storage().put_bytes(b"mp3", ".mp3"))
+    asyncio.run(elevenlabs._speech_cache().set(elevenlabs._speech_cache_key("v1", "hello"), {"audio_url": blob["url"]}))
+
+    assert asyncio.run(elevenlabs.generate_speech("v1", "hello")) == blob["url"]
+    _clone("c")
+
+    assert upstream["deleted"] == ["v2"]
@@ -0,0 +1,115 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.v1 import webhooks
+from app.services import prediction_store, replicate
+
+SECRET = "whsec_" + base64.b64encode(b"test-signing-key").decode()
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(webhooks.router, prefix="/api/v1")
+    return TestClient(app)
+
+
+def _signed(body: str, secret: str = SECRET) -> dict:
+    webhook_id, timestamp = "msg_1", str(int(time.time()))
+    key = base64.b64decode(secret.split("_")[1])
+    digest = hmac.new(key, f"{webhook_id}.{timestamp}.{body}".encode(), hashlib.sha256).digest()
+    return {
+        "webhook-id": webhook_id,
+        "webhook-timestamp": timestamp,
+        "webhook-signature": f"v1,{base64.b64encode(digest).decode()}",
+    }
+
+
+def _payload(prediction_id: str) -> str:
+    return json.dumps({"id": prediction_id, "status": "succeeded", "output": "https://out/video.mp4"})
+
+
+def test_webhooks_are_off_without_a_secret(client):
+    prediction_store.track({"id": "p1", "status": "starting"})
+    body = _payload("p1")
+
+    response = client.post("/api/v1/webhooks/replicate", content=body, headers=_signed(body))
+
+    assert response.status_code == 404
+    assert prediction_store.get("p1")["status"] == "starting"
+
+
+def test_bad_signature_is_rejected(client, settings):
+    settings.replicate_webhook_secret = SECRET
+    prediction_store.track({"id": "p1", "status": "starting"})
+    body = _payload("p1")
+    other_secret = "whsec_" + base64.b64encode(b"someone-else").decode()
+
+    response = client.post("/api/v1/webhooks/replicate", content=body, headers=_signed(body, other_secret))
+
+    assert response.status_code == 401
+    assert prediction_store.get("p1")["status"] == "starting"
+
+
+def test_untracked_prediction_is_ignored(client, settings):
+    settings.replicate_webhook_secret = SECRET
+    body = _payload("not-ours")
+
+    response = client.post("/api/v1/webhooks/replicate", content=body, headers=_signed(body))
+
+    assert response.json() == {"status": "ignored"}
+    assert not prediction_store.is_tracked("not-ours")
+
+
+def test_signed_update_for_tracked_prediction_is_stored(client, settings):
+    settings.replicate_webhook_secret = SECRET
+    prediction_store.track({"id": "p1", "status": "starting"})
+    body = _payload("p1")
+
+    response = client.post("/api/v1/webhooks/replicate", content=body, headers=_signed(body))
+
+    assert response.json() == {"status": "ok"}
+    assert prediction_store.get("p1") == {
+        "id": "p1",
+        "status": "succeeded",
+        "output": "https://out/video.mp4",
+        "error": None,
+    }
+
+
+def test_webhook_url_needs_public_base_url_and_secret(settings):
+    settings.public_base_url = "https://api.example.com"
+    assert replicate._webhook_params() == {}
+
+    settings.replicate_webhook_secret = SECRET
+    assert replicate._webhook_params()["webhook"] == "https://api.example.com/api/v1/webhooks/replicate"
+
+
+def test_poller_leaves_webhook_predictions_to_the_webhook(monkeypatch, settings):
+    fetched = []
+
+    async def get_prediction_status(prediction_id):
+        fetched.append(prediction_id)
+        return {"id": prediction_id, "status": "processing", "output": None, "error": None}
+
+    monkeypatch.setattr(replicate, "get_prediction_status", get_prediction_status)
+    prediction_store.track({"id": "hooked", "status": "starting", "webhook": True})
+    prediction_store.track({"id": "polled", "status": "starting", "webhook": False})
+
+    now = time.monotonic()
+    monkeypatch.setattr(time, "monotonic", lambda: now + settings.prediction_poll_interval + 1)
+    asyncio.run(prediction_store._refresh_in_flight())
+    assert fetched == ["polled"]
+    assert prediction_store.get("hooked")["status"] == "starting"
+
+    monkeypatch.setattr(time, "monotonic", lambda: now + settings.prediction_webhook_fallback_interval + 1)
+    asyncio.run(prediction_store._refresh_in_flight())
+    assert sorted(fetched) == ["hooked", "polled", "polled"]